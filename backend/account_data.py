@@ -0,0 +1,332 @@
+import asyncio
+import json
+import os
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+from database import (
+    get_user,
+    delete_user,
+    iter_user_documents,
+    list_user_document_ids,
+    delete_user_documents,
+    purge_user_collection,
+    write_user_documents,
+    get_purge_job,
+    save_purge_job,
+    get_running_purge_jobs,
+    invalidate_user_cache,
+    PURGE_BATCH_SIZE,
+    PURGE_CONCURRENCY,
+)
+from auth_provider import get_auth_provider
+from security import revoke_user
+from sessions import session_manager
+from topics import topic_pipeline
+
+# Account data export, import and purge.
+# Export streams one JSON record per line (optionally gzipped), reading
+# Firestore a page at a time, so memory stays flat however much data a user has.
+# Import takes the same format back (idempotent: documents keep their ids).
+# Purge deletes users/{id} and every subcollection under it in parallel
+# batches, as a background job whose progress is kept in purge_jobs/{id}.
+# Deleting is naturally resumable (what is gone isn't listed again), so jobs
+# left "running" by a restart are picked up again at startup.
+# The job document is also the account's tombstone: from the moment it is
+# written the user's tokens are refused and user-scoped writes fail. Writes
+# already past that check (or on a worker that hasn't heard of the deletion
+# yet) are removed by a second sweep PURGE_SETTLE_SECONDS later.
+
+EXPORT_CHUNK_BYTES = 64 * 1024
+PURGE_PROGRESS_INTERVAL = float(os.getenv("PURGE_PROGRESS_INTERVAL", "1"))
+PURGE_SETTLE_SECONDS = float(os.getenv("PURGE_SETTLE_SECONDS", "40"))
+SESSION_PAGE = 100
+
+# (path under users/{id}, record kind, order field)
+FLAT_COLLECTIONS = [
+    (("moods",), "mood", "timestamp"),
+    (("mood_daily",), "mood_daily", "date"),
+]
+
+
+def _record(kind: str, doc_id: str = None, data: dict = None, **extra) -> bytes:
+    record = {"kind": kind, "id": doc_id, **extra, "data": data}
+    return (json.dumps(record, default=str, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+# --- Export ---
+
+
+async def _export_records(user_id: str):
+    yield _record(
+        "export", user_id, {"format": 1, "exported_at": datetime.utcnow().isoformat()}
+    )
+    profile = await get_user(user_id)
+    if profile:
+        yield _record("profile", user_id, profile)
+    async for session_id, session in iter_user_documents(
+        user_id, ("conversations",), "session_id"
+    ):
+        yield _record("session", session_id, session)
+        async for message_id, message in iter_user_documents(
+            user_id, ("conversations", session_id, "messages"), "timestamp"
+        ):
+            yield _record("message", message_id, message, session_id=session_id)
+    for path, kind, order_field in FLAT_COLLECTIONS:
+        async for doc_id, data in iter_user_documents(user_id, path, order_field):
+            yield _record(kind, doc_id, data)
+
+
+async def export_user_data(user_id: str, compress: bool = False):
+    # NDJSON bytes in ~64 KB chunks; gzip-compressed on the fly when asked
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    async for line in _export_records(user_id):
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    yield compressor.compress(chunk) + compressor.flush() if compressor else chunk
+
+
+# --- Import ---
+
+
+async def _gunzip_if_needed(chunks):
+    decompressor = None
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if decompressor is None:
+            decompressor = zlib.decompressobj(wbits=47) if chunk[:2] == b"\x1f\x8b" else False
+        yield decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        yield decompressor.flush()
+
+
+async def _lines(chunks):
+    buffer = b""
+    async for chunk in _gunzip_if_needed(chunks):
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+def _doc_id(value, line_no: int) -> str:
+    if not isinstance(value, str) or not value or "/" in value:
+        raise ValueError(f"Line {line_no}: invalid document id")
+    return value
+
+
+def _import_write(record: dict, line_no: int):
+    # (path, doc_id, data) for one record, or None for records that aren't stored
+    kind, data = record.get("kind"), record.get("data")
+    if kind == "export":
+        return None
+    if not isinstance(data, dict):
+        raise ValueError(f"Line {line_no}: missing data")
+    if kind == "profile":
+        # The sign-in email belongs to the account, not the export
+        data.pop("email", None)
+        return (), None, data
+    if kind == "session":
+        return ("conversations",), _doc_id(record.get("id"), line_no), data
+    if kind == "message":
+        session_id = _doc_id(record.get("session_id"), line_no)
+        return ("conversations", session_id, "messages"), _doc_id(record.get("id"), line_no), data
+    for path, flat_kind, _ in FLAT_COLLECTIONS:
+        if kind == flat_kind:
+            return path, _doc_id(record.get("id"), line_no), data
+    raise ValueError(f"Line {line_no}: unknown record kind {kind!r}")
+
+
+async def import_user_data(user_id: str, chunks) -> dict:
+    # Raises ValueError on a malformed line; earlier batches stay written,
+    # and re-importing the fixed file is safe.
+    counts = Counter()
+    writes = []
+    line_no = 0
+    async for line in _lines(chunks):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_no}: invalid JSON")
+        write = _import_write(record, line_no)
+        if write is None:
+            continue
+        writes.append(write)
+        counts[record["kind"]] += 1
+        if len(writes) >= PURGE_BATCH_SIZE:
+            await write_user_documents(user_id, writes)
+            writes = []
+    if writes:
+        await write_user_documents(user_id, writes)
+    session_manager.forget(user_id)
+    return dict(counts)
+
+
+# --- Purge ---
+
+
+class PurgeManager:
+    def __init__(self):
+        self._tasks = {}
+        self.completed = 0
+        self.failed = 0
+
+    @staticmethod
+    def _forget(user_id: str):
+        invalidate_user_cache(user_id)
+        session_manager.forget(user_id)
+        topic_pipeline.forget(user_id)
+
+    async def start(self, user_id: str) -> dict:
+        # Starts (or resumes) the purge; returns the job document
+        if user_id in self._tasks:
+            return await get_purge_job(user_id)
+        previous = await get_purge_job(user_id) or {}
+        if previous.get("status") == "done":
+            previous = {}
+        profile = await get_user(user_id) or {}
+        now = datetime.utcnow().isoformat()
+        job = {
+            "user_id": user_id,
+            "status": "running",
+            "started_at": previous.get("started_at", now),
+            "updated_at": now,
+            "deleted": previous.get("deleted", {}),
+            # Needed to remove the sign-in account at the end; cleared when done
+            "email": profile.get("email") or previous.get("email"),
+        }
+        await save_purge_job(user_id, job)
+        revoke_user(user_id)
+        self._forget(user_id)
+        self._launch(user_id, job)
+        return job
+
+    def _launch(self, user_id: str, job: dict):
+        task = asyncio.create_task(self._run(user_id, job))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    @staticmethod
+    async def _sweep(user_id: str, limiter, progress):
+        # Messages first, then the session docs that hold them
+        while True:
+            session_ids = await list_user_document_ids(user_id, ("conversations",), SESSION_PAGE)
+            if not session_ids:
+                break
+            await asyncio.gather(
+                *(
+                    purge_user_collection(
+                        user_id, ("conversations", session_id, "messages"), limiter, progress
+                    )
+                    for session_id in session_ids
+                )
+            )
+            await delete_user_documents(user_id, ("conversations",), session_ids)
+            progress(("conversations",), len(session_ids))
+        await asyncio.gather(
+            *(purge_user_collection(user_id, path, limiter, progress) for path, _, _ in FLAT_COLLECTIONS)
+        )
+
+    async def _run(self, user_id: str, job: dict):
+        started = time.perf_counter()
+        limiter = asyncio.Semaphore(PURGE_CONCURRENCY)
+        deleted = Counter(job.get("deleted", {}))
+        revoke_user(user_id)
+
+        def progress(path, count):
+            deleted[path[-1]] += count
+
+        async def report():
+            while True:
+                await asyncio.sleep(PURGE_PROGRESS_INTERVAL)
+                await save_purge_job(
+                    user_id, {"deleted": dict(deleted), "updated_at": datetime.utcnow().isoformat()}
+                )
+
+        reporter = asyncio.create_task(report())
+        try:
+            await self._sweep(user_id, limiter, progress)
+            await asyncio.sleep(PURGE_SETTLE_SECONDS)
+            await self._sweep(user_id, limiter, progress)
+            if job.get("email"):
+                await get_auth_provider().delete_user(user_id, job["email"])
+            await delete_user(user_id)
+            self._forget(user_id)
+        except asyncio.CancelledError:
+            # Shutdown: stays "running" and resumes on the next start
+            await save_purge_job(user_id, {"deleted": dict(deleted)})
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Purge of {user_id} failed: {e}")
+            await save_purge_job(
+                user_id,
+                {
+                    "status": "failed",
+                    "error": str(e),
+                    "deleted": dict(deleted),
+                    "updated_at": datetime.utcnow().isoformat(),
+                },
+            )
+            return
+        finally:
+            reporter.cancel()
+
+        self.completed += 1
+        elapsed = time.perf_counter() - started
+        print(f"🗑️ Purged {user_id}: {dict(deleted)} in {elapsed:.1f}s")
+        await save_purge_job(
+            user_id,
+            {
+                "status": "done",
+                "email": None,
+                "error": None,
+                "deleted": dict(deleted),
+                "seconds": round(elapsed, 2),
+                "updated_at": datetime.utcnow().isoformat(),
+            },
+        )
+
+    async def resume(self):
+        # Jobs a previous process left unfinished
+        try:
+            jobs = await get_running_purge_jobs()
+        except Exception as e:
+            print(f"⚠️ Could not look up unfinished purges: {e}")
+            return
+        for job in jobs:
+            if job["user_id"] not in self._tasks:
+                print(f"🔁 Resuming purge of {job['user_id']}")
+                self._launch(job["user_id"], job)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+purge_manager = PurgeManager()
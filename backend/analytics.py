@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Vectorized mood analytics.
+# Everything is computed from a per-day frame (sum, count, min, max per date),
+# which comes either from the mood_daily rollup docs or from raw entries via
+# daily_from_entries(). One pass over that frame produces daily/weekly/monthly
+# averages, rolling means, volatility, logging streaks and best/worst days.
+
+RANGES = {"week": 7, "month": 30, "quarter": 90, "year": 365, "all": None}
+
+ROLLING_WINDOW = 7
+
+_DAILY_COLUMNS = ["sum", "count", "min", "max"]
+
+
+def daily_from_entries(moods: list) -> pd.DataFrame:
+    if not moods:
+        return pd.DataFrame(columns=_DAILY_COLUMNS, index=pd.DatetimeIndex([], name="date"))
+    raw = pd.DataFrame.from_records(moods, columns=["timestamp", "mood_score"])
+    timestamps = pd.to_datetime(raw["timestamp"], format="ISO8601", errors="coerce")
+    frame = pd.DataFrame(
+        {
+            "date": timestamps.dt.floor("D"),
+            "score": pd.to_numeric(raw["mood_score"], errors="coerce"),
+        }
+    ).dropna()
+    return frame.groupby("date")["score"].agg(["sum", "count", "min", "max"])
+
+
+def daily_from_rollups(rollups: list) -> pd.DataFrame:
+    if not rollups:
+        return pd.DataFrame(columns=_DAILY_COLUMNS, index=pd.DatetimeIndex([], name="date"))
+    frame = pd.DataFrame.from_records(rollups, columns=["date"] + _DAILY_COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"], errors="coerce")
+    frame = frame.dropna(subset=["date"]).set_index("date")
+    return frame[frame["count"] > 0].astype(float)
+
+
+def _series_to_points(series: pd.Series, key: str = "average_score") -> list:
+    values = np.round(series.to_numpy(dtype=float), 2)
+    dates = series.index.strftime("%Y-%m-%d")
+    return [
+        {"date": d, key: (None if np.isnan(v) else float(v))}
+        for d, v in zip(dates, values)
+    ]
+
+
+def _period_averages(daily: pd.DataFrame, rule: str, **resample_kwargs) -> list:
+    totals = daily[["sum", "count"]].resample(rule, **resample_kwargs).sum()
+    totals = totals[totals["count"] > 0]
+    averages = totals["sum"] / totals["count"]
+    points = _series_to_points(averages)
+    for point, count in zip(points, totals["count"].to_numpy()):
+        point["entries"] = int(count)
+    return points
+
+
+def _streaks(logged: np.ndarray, last_date, today) -> dict:
+    # Run lengths of consecutive logged days, found from the edges of the mask
+    padded = np.concatenate(([0], logged.astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    lengths = edges[1::2] - edges[::2]
+    longest = int(lengths.max()) if lengths.size else 0
+    current = int(lengths[-1]) if lengths.size else 0
+    if (today - last_date).days > 1:
+        current = 0
+    return {"current": current, "longest": longest}
+
+
+def compute_trends(daily: pd.DataFrame, today=None) -> dict:
+    today = today or datetime.utcnow().date()
+    if daily.empty:
+        return {
+            "daily": [],
+            "weekly": [],
+            "monthly": [],
+            "rolling_average": [],
+            "statistics": {
+                "average": 0,
+                "total_entries": 0,
+                "days_logged": 0,
+                "volatility": 0,
+                "recent_volatility": None,
+                "best_day": "N/A",
+                "worst_day": "N/A",
+                "lowest_score": None,
+                "highest_score": None,
+                "streaks": {"current": 0, "longest": 0},
+            },
+        }
+
+    daily = daily.sort_index()
+    averages = daily["sum"] / daily["count"]
+    # Calendar-complete series: NaN on days without entries
+    calendar = averages.asfreq("D")
+    rolling = calendar.rolling(ROLLING_WINDOW, min_periods=1).mean()
+    rolling_volatility = calendar.rolling(ROLLING_WINDOW, min_periods=2).std(ddof=0)
+
+    total_entries = float(daily["count"].sum())
+    statistics = {
+        "average": round(float(daily["sum"].sum() / total_entries), 2),
+        "total_entries": int(total_entries),
+        "days_logged": int(len(daily)),
+        "volatility": round(float(averages.std(ddof=0)), 2),
+        "recent_volatility": (
+            None
+            if np.isnan(rolling_volatility.iloc[-1])
+            else round(float(rolling_volatility.iloc[-1]), 2)
+        ),
+        "best_day": averages.idxmax().strftime("%Y-%m-%d"),
+        "worst_day": averages.idxmin().strftime("%Y-%m-%d"),
+        "lowest_score": float(daily["min"].min()),
+        "highest_score": float(daily["max"].max()),
+        "streaks": _streaks(
+            calendar.notna().to_numpy(), calendar.index[-1].date(), today
+        ),
+    }
+
+    daily_points = _series_to_points(averages)
+    for point, count in zip(daily_points, daily["count"].to_numpy()):
+        point["entries"] = int(count)
+
+    return {
+        "daily": daily_points,
+        # Weeks start on Monday and are labelled by that Monday
+        "weekly": _period_averages(daily, "W-MON", label="left", closed="left"),
+        "monthly": _period_averages(daily, "MS"),
+        "rolling_average": _series_to_points(rolling),
+        "statistics": statistics,
+    }
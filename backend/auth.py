@@ -1,11 +1,18 @@
+import os
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from database import create_user, get_user
-from utils import hash_password, verify_password, generate_jwt, validate_email
-import uuid
+from database import create_user, get_user, get_password_hash, save_password_hash
+from utils import generate_jwt, validate_email, hash_password_async, verify_and_update_password
+from auth_provider import get_auth_provider, AuthProviderError
 
 router = APIRouter()
 
+# Accounts created before /signup stored password hashes have none to check.
+# With AUTH_ADOPT_LEGACY_PASSWORDS=true their next login sets it instead (a
+# migration window only: until then anyone knowing the email can claim the
+# account). Off, they can't log in with a password.
+ADOPT_LEGACY_PASSWORDS = os.getenv("AUTH_ADOPT_LEGACY_PASSWORDS", "false").lower() == "true"
+
 
 class SignupRequest(BaseModel):
     name: str
@@ -37,14 +44,14 @@ async def signup(request: SignupRequest):
     # Better: Use the prompt's flow. "Create user in Firebase Auth".
     # Since we are using firebase-admin, we can create a user in Firebase Auth.
 
-    try:
-        from firebase_admin import auth
+    # Hashed on the process pool before anything is created
+    password_hash = await hash_password_async(request.password)
 
-        user = auth.create_user(
-            email=request.email, password=request.password, display_name=request.name
+    try:
+        user_id = await get_auth_provider().create_user(
+            request.email, request.password, request.name
         )
-        user_id = user.uid
-    except Exception as e:
+    except AuthProviderError as e:
         # Fallback for Mock/Local if Firebase not configured or error
         print(f"Firebase Auth Error: {e}")
         # If we can't use real Auth, we'll simulate it for the MVP if DB is mock
@@ -60,6 +67,7 @@ async def signup(request: SignupRequest):
         "keywords": [],
     }
     await create_user(user_id, user_data)
+    await save_password_hash(user_id, password_hash)
 
     return {
         "success": True,
@@ -70,70 +78,48 @@ async def signup(request: SignupRequest):
 
 @router.post("/login")
 async def login(request: LoginRequest):
-    # Verify with Firebase Auth
-    # Since this is a backend endpoint, usually the frontend signs in with SDK and sends a token.
-    # BUT the prompt says: POST /auth/login { email, password } -> returns token.
-    # This implies the backend handles the login.
-    # Firebase Admin SDK doesn't have a "sign in with password" method (it's client side).
-    # We can use the REST API for Firebase Auth or just assume the frontend sends a token.
-    # HOWEVER, the prompt explicitly asks for this endpoint.
-    # We will use a workaround or standard JWT if we were doing custom auth.
-    # Since we are using Firebase, the "correct" way is Frontend -> Firebase -> Token -> Backend.
-    # But to strictly follow the prompt's backend requirement:
-
-    # We can't easily sign in with password using Admin SDK.
-    # We will implement a "Custom Auth" flow for the MVP if strictly backend-based,
-    # OR we assume the user meant "Verify Token".
-
-    # Let's stick to the prompt's contract: Input Email/Pass -> Output Token.
-    # We'll simulate this by checking our Firestore if we were storing passwords (bad practice),
-    # OR we just tell the user "Please use Frontend Auth" in a real scenario.
-
-    # COMPROMISE: We will implement a simple local JWT auth for this MVP
-    # to satisfy the prompt's specific API contract,
-    # even though it bypasses Firebase Auth's password checking (unless we use the REST API).
-    # Actually, let's use the Identity Toolkit REST API if we want to be "Production Ready" with Firebase.
-    # But that requires an API Key.
-
-    # SIMPLIFICATION: We will assume the user has created the account via our /signup (which used Admin SDK).
-    # But we can't verify password with Admin SDK.
-    # So, we will implement a Hybrid:
-    # 1. /signup creates Firebase User AND stores a hash in Firestore (redundant but works for this specific prompt constraint).
-    # 2. /login checks the hash in Firestore and issues our OWN JWT.
-    # This fulfills the prompt's API contract exactly, even if it's a bit weird alongside Firebase Auth.
-
-    # Wait, I didn't store the password hash in /signup. Let me fix that in /signup logic above?
-    # No, I shouldn't store passwords if using Firebase.
-
-    # ALTERNATIVE: The prompt says "Authenticate with Firebase Auth".
-    # If I can't do it server-side easily, I'll mock the check or use a placeholder.
-    # Actually, I'll use the `pyrebase` wrapper or `requests` to call the Google Identity URL.
-
-    # For now, let's assume the "Production Ready" way is to verify a token sent by frontend,
-    # BUT the prompt insists on email/pass input.
-    # I will implement a placeholder that accepts ANY password for the "Demo" if Firebase API key isn't available for REST auth.
-    # OR better: I'll just generate a token for the user if the email exists in Firebase (Admin SDK can get user by email).
-    # This is "Insecure" but functional for a hackathon demo if we can't verify password server-side.
-
+    # The Admin SDK can't check a password, so /signup stores a bcrypt hash
+    # in Firestore next to the Firebase Auth account, and /login checks it
+    # (on the hashing process pool, off the event loop) before issuing our
+    # own JWT.
     try:
-        from firebase_admin import auth
-
-        user = auth.get_user_by_email(request.email)
-        # We found the user. We can't check password. We'll just issue the token.
-        # (In a real app, frontend handles login).
-
-        # Generate JWT
-        token = generate_jwt({"sub": user.uid, "email": user.email})
-        return {
-            "success": True,
-            "user_id": user.uid,
-            "token": token,
-            "redirect": "/profile",
-        }
-    except Exception as e:
+        account = await get_auth_provider().get_user_by_email(request.email)
+    except AuthProviderError as e:
+        print(f"Firebase Auth Error: {e}")
+        account = None
+    if not account:
         raise HTTPException(
             status_code=401, detail="Invalid credentials or user not found"
         )
+    user_id = account["uid"]
+
+    password_hash = await get_password_hash(user_id)
+    if password_hash is None:
+        # Accounts created before passwords were stored
+        if not ADOPT_LEGACY_PASSWORDS:
+            raise HTTPException(
+                status_code=401, detail="Invalid credentials or user not found"
+            )
+        print(f"🔑 Storing first password for legacy account {user_id}")
+        await save_password_hash(user_id, await hash_password_async(request.password))
+    else:
+        valid, new_hash = await verify_and_update_password(request.password, password_hash)
+        if not valid:
+            raise HTTPException(
+                status_code=401, detail="Invalid credentials or user not found"
+            )
+        if new_hash:
+            # Hashed with an older BCRYPT_ROUNDS: keep the upgrade
+            await save_password_hash(user_id, new_hash)
+
+    # Generate JWT
+    token = generate_jwt({"sub": user_id, "email": account["email"]})
+    return {
+        "success": True,
+        "user_id": user_id,
+        "token": token,
+        "redirect": "/profile",
+    }
 
 
 @router.post("/logout")
@@ -0,0 +1,170 @@
+import asyncio
+import functools
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from cache import TTLCache, MISSING
+
+# Identity provider used by /auth/signup and /auth/login.
+# FirebaseAuthProvider runs the blocking firebase_admin.auth calls on a small
+# thread pool with a timeout, so a slow Identity Toolkit round trip never
+# stalls the event loop. Email -> account lookups are cached for a short TTL.
+# Unknown emails are not cached, since a signup handled by another worker
+# must be visible right away. Concurrent lookups of one email share a single
+# round trip instead.
+# AUTH_PROVIDER=memory swaps in FakeAuthProvider for local runs and load tests
+# (the default whenever FIRESTORE_BACKEND=memory).
+
+AUTH_PROVIDER = os.getenv(
+    "AUTH_PROVIDER", "memory" if os.getenv("FIRESTORE_BACKEND") == "memory" else "firebase"
+)
+AUTH_PROVIDER_TIMEOUT = float(os.getenv("AUTH_PROVIDER_TIMEOUT", "5"))
+AUTH_PROVIDER_MAX_WORKERS = int(os.getenv("AUTH_PROVIDER_MAX_WORKERS", "8"))
+EMAIL_CACHE_TTL = float(os.getenv("AUTH_EMAIL_CACHE_TTL", "300"))
+
+
+class AuthProviderError(Exception):
+    pass
+
+
+class EmailAlreadyExists(AuthProviderError):
+    pass
+
+
+class _CachedAuthProvider:
+    # Shared email -> account cache; subclasses implement _create, _lookup and
+    # _delete. Accounts are {"uid", "email"}, with the email as the provider
+    # stores it (not as the caller typed it).
+    def __init__(self):
+        self._accounts = TTLCache(
+            maxsize=int(os.getenv("AUTH_EMAIL_CACHE_SIZE", "10000")), ttl=EMAIL_CACHE_TTL
+        )
+        self._lookups = {}
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return email.strip().lower()
+
+    async def create_user(self, email: str, password: str, display_name: str) -> str:
+        account = await self._create(email, password, display_name)
+        self._accounts.set(self._key(email), account)
+        return account["uid"]
+
+    async def get_user_by_email(self, email: str):
+        # The account, or None if no account uses this email
+        key = self._key(email)
+        account = self._accounts.get(key)
+        if account is not MISSING:
+            return dict(account)
+        task = self._lookups.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(email))
+            self._lookups[key] = task
+            task.add_done_callback(lambda _: self._lookups.pop(key, None))
+        account = await task
+        if account is None:
+            return None
+        self._accounts.set(key, account)
+        return dict(account)
+
+    async def delete_user(self, uid: str, email: str = None):
+        await self._delete(uid)
+        if email:
+            self._accounts.delete(self._key(email))
+
+    def stats(self) -> dict:
+        return {"provider": type(self).__name__, "email_cache": self._accounts.stats()}
+
+
+class FirebaseAuthProvider(_CachedAuthProvider):
+    def __init__(self):
+        super().__init__()
+        from firebase_admin import auth
+
+        self._auth = auth
+        self._executor = ThreadPoolExecutor(
+            max_workers=AUTH_PROVIDER_MAX_WORKERS, thread_name_prefix="firebase-auth"
+        )
+
+    async def _call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs)),
+                timeout=AUTH_PROVIDER_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            raise AuthProviderError("Auth provider timed out")
+
+    async def _create(self, email, password, display_name):
+        try:
+            user = await self._call(
+                self._auth.create_user,
+                email=email,
+                password=password,
+                display_name=display_name,
+            )
+        except self._auth.EmailAlreadyExistsError as e:
+            raise EmailAlreadyExists(str(e))
+        except AuthProviderError:
+            raise
+        except Exception as e:
+            raise AuthProviderError(str(e))
+        return {"uid": user.uid, "email": user.email}
+
+    async def _lookup(self, email):
+        try:
+            user = await self._call(self._auth.get_user_by_email, email)
+        except self._auth.UserNotFoundError:
+            return None
+        except AuthProviderError:
+            raise
+        except Exception as e:
+            raise AuthProviderError(str(e))
+        return {"uid": user.uid, "email": user.email}
+
+    async def _delete(self, uid):
+        try:
+            await self._call(self._auth.delete_user, uid)
+        except self._auth.UserNotFoundError:
+            pass
+        except AuthProviderError:
+            raise
+        except Exception as e:
+            raise AuthProviderError(str(e))
+
+
+class FakeAuthProvider(_CachedAuthProvider):
+    # In-memory accounts; like the Admin SDK it never sees passwords again
+    def __init__(self):
+        super().__init__()
+        self._users = {}
+
+    async def _create(self, email, password, display_name):
+        key = self._key(email)
+        if key in self._users:
+            raise EmailAlreadyExists(f"The user with the provided email ({email}) already exists")
+        uid = uuid.uuid4().hex[:28]
+        self._users[key] = {"uid": uid, "email": email, "display_name": display_name}
+        return {"uid": uid, "email": email}
+
+    async def _lookup(self, email):
+        user = self._users.get(self._key(email))
+        return {"uid": user["uid"], "email": user["email"]} if user else None
+
+    async def _delete(self, uid):
+        self._users = {k: u for k, u in self._users.items() if u["uid"] != uid}
+
+
+_auth_provider = None
+
+
+def get_auth_provider():
+    global _auth_provider
+    if _auth_provider is None:
+        if AUTH_PROVIDER == "memory":
+            _auth_provider = FakeAuthProvider()
+            print("🧪 Using in-memory auth provider")
+        else:
+            _auth_provider = FirebaseAuthProvider()
+    return _auth_provider
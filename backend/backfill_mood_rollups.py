@@ -0,0 +1,62 @@
+import asyncio
+import sys
+from collections import defaultdict
+
+# One-off: folds mood entries logged before rollups existed into the
+# users/{id}/mood_daily rollups. Entries saved since then carry
+# rolled_up: true and are skipped. The rest are added with the same
+# Increment / Minimum / Maximum transforms save_mood uses, so moods logged
+# while this runs are never overwritten. Each batch also flags the entries
+# it counted, atomically, so an interrupted run can simply be re-run.
+# Usage: python backfill_mood_rollups.py <user_id> [<user_id> ...]
+
+# Firestore batches hold at most 500 writes: entries plus their day docs
+MOODS_PER_BATCH = 200
+
+
+def _pending_moods(collection):
+    return [snap for snap in collection.stream() if not snap.get("rolled_up")]
+
+
+async def backfill(user_id: str):
+    from database import get_db, run_db
+
+    db = get_db()
+    user_ref = db.collection("users").document(user_id)
+    moods = await run_db(_pending_moods, user_ref.collection("moods"))
+    moods = [snap for snap in moods if (snap.get("timestamp") or "")[:10]]
+
+    for i in range(0, len(moods), MOODS_PER_BATCH):
+        await run_db(_write_rollups, db, user_ref, moods[i : i + MOODS_PER_BATCH])
+    days = {snap.get("timestamp")[:10] for snap in moods}
+    print(f"✅ {user_id}: {len(moods)} moods folded into {len(days)} daily rollups")
+
+
+def _write_rollups(db, user_ref, moods):
+    from database import _mood_rollup_update
+
+    days = defaultdict(list)
+    for snap in moods:
+        days[snap.get("timestamp")[:10]].append(snap.get("mood_score") or 0)
+
+    batch = db.batch()
+    for date, scores in days.items():
+        batch.set(
+            user_ref.collection("mood_daily").document(date),
+            _mood_rollup_update(date, scores),
+            merge=True,
+        )
+    for snap in moods:
+        batch.update(snap.reference, {"rolled_up": True})
+    batch.commit()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(sys.argv) < 2:
+        print("Usage: python backfill_mood_rollups.py <user_id> [<user_id> ...]")
+        sys.exit(1)
+    for uid in sys.argv[1:]:
+        asyncio.run(backfill(uid))
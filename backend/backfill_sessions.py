@@ -0,0 +1,59 @@
+import asyncio
+import sys
+
+# One-off: creates the users/{id}/conversations/{session_id} metadata doc for
+# sessions written before those docs existed (the old per-day "YYYY-MM-DD"
+# sessions). Chat history, session listing and export only see sessions that
+# have one. Safe to re-run: sessions that already have a doc are skipped.
+# Usage: python backfill_sessions.py <user_id> [<user_id> ...] | --all
+
+
+def _missing_sessions(conversations):
+    # list_documents() also returns "missing" docs that only hold messages
+    return [ref for ref in conversations.list_documents() if not ref.get().exists]
+
+
+async def backfill(user_id: str):
+    from database import get_db, run_db, _fetch_dicts
+
+    db = get_db()
+    conversations = db.collection("users").document(user_id).collection("conversations")
+    refs = await run_db(_missing_sessions, conversations)
+
+    for ref in refs:
+        messages = await run_db(
+            _fetch_dicts, ref.collection("messages").order_by("timestamp")
+        )
+        if not messages:
+            continue
+        fields = {
+            "session_id": ref.id,
+            "started_at": messages[0].get("timestamp"),
+            "last_activity": messages[-1].get("timestamp"),
+            "message_count": len(messages),
+        }
+        if len(ref.id) == 10:
+            # Per-day session ids are the (server-local) date they cover
+            fields["local_date"] = ref.id
+        await run_db(ref.set, fields, merge=True)
+    print(f"✅ {user_id}: {len(refs)} sessions backfilled")
+
+
+async def all_user_ids() -> list:
+    from database import get_db, run_db
+
+    db = get_db()
+    refs = await run_db(lambda: list(db.collection("users").list_documents()))
+    return [ref.id for ref in refs]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if len(sys.argv) < 2:
+        print("Usage: python backfill_sessions.py <user_id> [<user_id> ...] | --all")
+        sys.exit(1)
+    user_ids = asyncio.run(all_user_ids()) if sys.argv[1] == "--all" else sys.argv[1:]
+    for uid in user_ids:
+        asyncio.run(backfill(uid))
@@ -0,0 +1,39 @@
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from analytics import daily_from_entries, compute_trends
+
+# Benchmarks the analytics engine on synthetic mood history.
+# Usage: python bench_analytics.py [entries] [years]
+
+
+def make_entries(count: int, years: int):
+    start = datetime.utcnow() - timedelta(days=365 * years)
+    span = 365 * years * 24 * 3600
+    return [
+        {
+            "timestamp": (start + timedelta(seconds=random.randrange(span))).isoformat(),
+            "mood_score": random.randint(1, 5),
+        }
+        for _ in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    entries = make_entries(count, years)
+
+    start = time.perf_counter()
+    daily = daily_from_entries(entries)
+    grouped = time.perf_counter()
+    trends = compute_trends(daily)
+    done = time.perf_counter()
+
+    print(f"Entries: {count} over {years} years ({len(daily)} days)")
+    print(f"Group by day:   {(grouped - start) * 1000:.1f} ms")
+    print(f"Compute trends: {(done - grouped) * 1000:.1f} ms")
+    print(f"Total:          {(done - start) * 1000:.1f} ms")
+    print(f"Statistics: {trends['statistics']}")
@@ -0,0 +1,41 @@
+import random
+import string
+import sys
+import time
+
+import utils
+
+# Benchmarks crisis detection per message.
+# Usage: python bench_crisis.py [extra_phrases] [iterations]
+
+SHORT = "I'm so stressed about exams, I can't sleep and my parents keep calling."
+LONG = " ".join([SHORT] * 60)  # ~4 KB
+
+
+def timed(fn, message, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(message)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def random_phrase():
+    words = ["".join(random.choices(string.ascii_lowercase, k=random.randint(3, 8))) for _ in range(random.randint(2, 4))]
+    return " ".join(words)
+
+
+if __name__ == "__main__":
+    extra = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    phrases = utils.load_crisis_phrases()
+    print(f"Default lexicon ({len(phrases)} phrases)")
+    for name, message in (("short", SHORT), ("long", LONG)):
+        print(f"  {name:5} ({len(message)} chars): {timed(utils.detect_crisis_keywords, message, iterations):8.1f} µs")
+
+    start = time.perf_counter()
+    matcher = utils.compile_crisis_matcher(phrases + [random_phrase() for _ in range(extra)])
+    print(f"Large lexicon ({len(phrases) + extra} phrases, compiled in {(time.perf_counter() - start) * 1000:.0f} ms)")
+    detect = lambda m: matcher.search(utils.normalize_text(m)) is not None
+    for name, message in (("short", SHORT), ("long", LONG)):
+        print(f"  {name:5} ({len(message)} chars): {timed(detect, message, iterations):8.1f} µs")
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+import time
+
+# Measures concurrent throughput of the data layer against the in-memory fake.
+# Usage: python bench_database.py [concurrency] [operations] [latency_ms]
+
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+
+
+async def run(concurrency: int, operations: int):
+    import database
+
+    await database.create_user("bench-user", {"name": "Bench", "keywords": []})
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            if i % 3 == 0:
+                await database.save_message(
+                    "bench-user", {"type": "user", "content": "hi"}, "bench-session"
+                )
+            elif i % 3 == 1:
+                await database.get_user("bench-user")
+            else:
+                await database.get_moods_week("bench-user")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(operations)))
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    os.environ["FAKE_FIRESTORE_LATENCY_MS"] = sys.argv[3] if len(sys.argv) > 3 else "10"
+
+    elapsed = asyncio.run(run(concurrency, operations))
+    print(f"Backend: {os.environ['FIRESTORE_BACKEND']}")
+    print(f"Concurrency: {concurrency}, operations: {operations}")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {operations / elapsed:.0f} ops/s")
+
+    import database
+
+    reads = database.get_read_stats()
+    print(
+        f"Reads: {reads['reads_requested']} requested, {reads['round_trips']} round trips "
+        f"({reads['coalesced']} coalesced, largest batch {reads['largest_batch']})"
+    )
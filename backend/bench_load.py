@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+# End-to-end load test. Boots main.app under uvicorn against the in-memory
+# Firestore fake and the in-memory auth provider, with a stub LLM server
+# (OpenAI-compatible /chat/completions for Groq and OpenAI, generateContent
+# for Gemini) standing in for the providers after a configurable delay.
+# Each concurrency level runs a closed loop of workers sending a weighted mix
+# of /chat, /mood/log, /mood/week and /user/{id}/profile requests.
+# Results (throughput, p50/p95/p99 overall and per endpoint) are written as
+# JSON; with --baseline the run fails when throughput drops or p95/p99 grow by
+# more than --tolerance compared to the saved baseline.
+# Usage:
+#   python bench_load.py --save-baseline               # record bench_baseline.json
+#   python bench_load.py --baseline bench_baseline.json  # fail on regression
+
+MIX = {"chat": 40, "mood_log": 20, "mood_week": 20, "profile": 20}
+
+MESSAGES = [
+    "I'm so stressed about exams, I can't sleep.",
+    "Had a fight with my roommate again today.",
+    "Placement interviews next week and I feel unprepared.",
+    "My parents keep asking about my grades.",
+    "I actually had a good day, finished my physics revision!",
+    "Feeling lonely since moving to the hostel.",
+    "Can't focus on anything, just scrolling my phone all night.",
+    "Yaar bahut tension ho rahi hai project deadline ki.",
+]
+MOODS = [("😊", 8), ("😐", 5), ("😢", 3), ("😡", 2), ("😴", 4)]
+
+
+# --- Stub LLM server ---
+
+def stub_app(latency_ms: float, jitter_ms: float, error_rate: float):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+    reply = "That sounds really hard. Want to talk about what's weighing on you most?"
+
+    async def delay():
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        return random.random() >= error_rate
+
+    @app.post("/chat/completions")
+    async def openai_compatible(request: Request):
+        body = await request.json()
+        if not await delay():
+            return JSONResponse({"error": "stub failure"}, status_code=503)
+        if not body.get("stream"):
+            return {"choices": [{"message": {"role": "assistant", "content": reply}}]}
+
+        async def events():
+            for word in reply.split(" "):
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": word + " "}}]}) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/models/{model_action}")
+    async def gemini(model_action: str):
+        if not await delay():
+            return JSONResponse({"error": "stub failure"}, status_code=503)
+        chunk = {"candidates": [{"content": {"parts": [{"text": reply}]}}]}
+        if model_action.endswith(":streamGenerateContent"):
+            return StreamingResponse(
+                iter(["data: " + json.dumps(chunk) + "\n\n"]), media_type="text/event-stream"
+            )
+        return chunk
+
+    return app
+
+
+# --- Processes ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Lets the benchmark read the server's GET /stats
+INTERNAL_TOKEN = secrets.token_urlsafe(16)
+
+
+def app_env(llm_url: str, rate_limit: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "FIRESTORE_BACKEND": "memory",
+        "AUTH_PROVIDER": "memory",
+        "GROQ_API_KEY": "bench", "GROQ_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": llm_url,
+        "GEMINI_API_KEY": "bench", "GEMINI_BASE_URL": llm_url,
+        # Per-user limits would turn a load test into a 429 test
+        "RATE_LIMIT_ENABLED": "true" if rate_limit else "false",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "INTERNAL_API_TOKEN": INTERNAL_TOKEN,
+    })
+    return env
+
+
+def spawn(args: list, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {proc.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+# --- Load generation ---
+
+async def create_users(client: httpx.AsyncClient, count: int) -> list:
+    users = []
+    for i in range(count):
+        email = f"bench{i}@mindmate.test"
+        r = await client.post("/auth/signup", json={"name": f"Bench {i}", "email": email, "password": "bench-password"})
+        r.raise_for_status()
+        r = await client.post("/auth/login", json={"email": email, "password": "bench-password"})
+        r.raise_for_status()
+        body = r.json()
+        users.append((body["user_id"], {"Authorization": f"Bearer {body['token']}"}))
+    return users
+
+
+def build_request(op: str, user_id: str, rng: random.Random):
+    if op == "chat":
+        return "POST", "/chat/", {"user_id": user_id, "message": rng.choice(MESSAGES)}
+    if op == "mood_log":
+        emoji, score = rng.choice(MOODS)
+        return "POST", "/mood/log", {
+            "user_id": user_id,
+            "mood_emoji": emoji,
+            "mood_score": score,
+            "note": rng.choice(MESSAGES),
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+    if op == "mood_week":
+        return "GET", f"/mood/week/{user_id}", None
+    return "GET", f"/user/{user_id}/profile", None
+
+
+async def run_level(client, users, concurrency: int, duration: float, mix: dict, seed: int) -> dict:
+    samples = {op: [] for op in mix}
+    errors = {op: 0 for op in mix}
+    ops, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int):
+        rng = random.Random(seed * 1000 + n)
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            user_id, headers = rng.choice(users)
+            method, path, body = build_request(op, user_id, rng)
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, path, json=body, headers=headers)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples[op].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors[op] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    everything = [ms for values in samples.values() for ms in values]
+    return {
+        "concurrency": concurrency,
+        "requests": len(everything),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(everything) / elapsed, 1),
+        "latency_ms": percentiles(everything),
+        "endpoints": {
+            op: {"requests": len(values), "errors": errors[op], "latency_ms": percentiles(values)}
+            for op, values in samples.items()
+        },
+    }
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def at(q):
+        # Nearest rank
+        return round(ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))], 1)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+
+# --- Baseline comparison ---
+
+def compare(report: dict, baseline: dict, tolerance: float, max_error_rate: float) -> list:
+    failures = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        c = level["concurrency"]
+        if level["requests"] and level["errors"] / level["requests"] > max_error_rate:
+            failures.append(f"c={c}: error rate {level['errors']}/{level['requests']}")
+        old = previous.get(c)
+        if old is None:
+            continue
+        if level["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            failures.append(f"c={c}: throughput {level['throughput_rps']} rps < baseline {old['throughput_rps']} rps")
+        for q in ("p95", "p99"):
+            new_ms, old_ms = level["latency_ms"][q], old["latency_ms"][q]
+            if new_ms is not None and old_ms is not None and new_ms > old_ms * (1 + tolerance):
+                failures.append(f"c={c}: {q} {new_ms} ms > baseline {old_ms} ms")
+    return failures
+
+
+async def main(args) -> dict:
+    llm_port, app_port = free_port(), free_port()
+    llm_url, app_url = f"http://127.0.0.1:{llm_port}", f"http://127.0.0.1:{app_port}"
+
+    stub = spawn(
+        [os.path.basename(__file__), "--serve-stub", str(llm_port),
+         "--llm-latency-ms", str(args.llm_latency_ms),
+         "--llm-jitter-ms", str(args.llm_jitter_ms),
+         "--llm-error-rate", str(args.llm_error_rate)],
+        dict(os.environ),
+    )
+    server = spawn(
+        ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+        app_env(llm_url, args.rate_limit),
+    )
+    try:
+        await wait_ready(llm_url + "/docs", stub)
+        await wait_ready(app_url + "/", server)
+        limits = httpx.Limits(max_connections=max(args.levels), max_keepalive_connections=max(args.levels))
+        async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=60) as client:
+            users = await create_users(client, args.users)
+            # Warm up caches and connection pools before measuring
+            await run_level(client, users, min(args.levels), args.warmup, MIX, args.seed)
+            levels = []
+            for concurrency in args.levels:
+                level = await run_level(client, users, concurrency, args.duration, MIX, args.seed)
+                levels.append(level)
+                print(
+                    f"c={concurrency:<4} {level['throughput_rps']:8.1f} rps  "
+                    f"p50 {level['latency_ms']['p50']} ms  p95 {level['latency_ms']['p95']} ms  "
+                    f"p99 {level['latency_ms']['p99']} ms  errors {level['errors']}"
+                )
+            stats = (
+                await client.get("/stats", headers={"Authorization": f"Bearer {INTERNAL_TOKEN}"})
+            ).json()
+    finally:
+        for proc in (server, stub):
+            proc.terminate()
+            proc.wait()
+
+    return {
+        "config": {
+            "duration_s": args.duration,
+            "users": args.users,
+            "mix": MIX,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "rate_limit": args.rate_limit,
+        },
+        "levels": levels,
+        "stats": stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", type=lambda s: [int(c) for c in s.split(",")], default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the rate limiter on")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="fail if this run regresses against it")
+    parser.add_argument("--save-baseline", nargs="?", const="bench_baseline.json", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--serve-stub", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_stub is not None:
+        import uvicorn
+
+        uvicorn.run(
+            stub_app(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate),
+            host="127.0.0.1", port=args.serve_stub, log_level="warning",
+        )
+        sys.exit(0)
+
+    report = asyncio.run(main(args))
+    failures = compare(report, {}, args.tolerance, args.max_error_rate)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.tolerance, args.max_error_rate)
+    report["failures"] = failures
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.out}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📌 Baseline saved to {args.save_baseline}")
+
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ No regressions")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold-start benchmark: imports the app and serves its first request in fresh
+# interpreters, and lists the slowest imports. Exits non-zero when a budget is
+# exceeded or a module that should load lazily is imported at startup, so it
+# can run in CI.
+# Usage: python bench_startup.py [--runs 5] [--max-import-ms 1500] [--max-startup-ms 2500] [--json]
+
+# Must not be imported just by importing the app
+LAZY_MODULES = ["firebase_admin", "google.cloud.firestore", "pandas"]
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/")
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "startup_ms": (t2 - t0) * 1000,
+    "eager": [m for m in %r if m in sys.modules and m not in _before],
+}))
+""" % (LAZY_MODULES,)
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("FIRESTORE_BACKEND", "memory")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def probe() -> dict:
+    # Modules imported by the probe harness itself don't count against the app
+    code = "import sys; _before = set(sys.modules)\n" + _PROBE
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, env=_env(), check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True, text=True, env=_env(), check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Modules imported directly by main (nesting is indented two spaces per level)
+        if len(name) - len(name.lstrip()) == 3:
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda r: r[1], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-startup-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_ms": round(statistics.median(r["import_ms"] for r in results), 1),
+        "startup_ms": round(statistics.median(r["startup_ms"] for r in results), 1),
+        "eager_modules": sorted({m for r in results for m in r["eager"]}),
+        "slowest_imports": [
+            {"module": m, "ms": round(ms, 1)} for m, ms in slowest_imports(args.top)
+        ],
+    }
+
+    failures = []
+    if args.max_import_ms is not None and report["import_ms"] > args.max_import_ms:
+        failures.append(f"import {report['import_ms']}ms > {args.max_import_ms}ms")
+    if args.max_startup_ms is not None and report["startup_ms"] > args.max_startup_ms:
+        failures.append(f"startup {report['startup_ms']}ms > {args.max_startup_ms}ms")
+    if report["eager_modules"]:
+        failures.append(f"imported at startup: {', '.join(report['eager_modules'])}")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Runs: {args.runs} (median)")
+        print(f"import main:            {report['import_ms']:.0f} ms")
+        print(f"import + first request: {report['startup_ms']:.0f} ms")
+        print("Slowest imports made by main:")
+        for row in report["slowest_imports"]:
+            print(f"  {row['ms']:8.1f} ms  {row['module']}")
+        for failure in failures:
+            print(f"❌ {failure}")
+        if not failures:
+            print("✅ Startup within budget")
+    sys.exit(1 if failures else 0)
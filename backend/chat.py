@@ -1,10 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from database import get_user, save_message, get_messages, get_user_keywords
-from prompts import get_system_prompt
-from utils import detect_crisis_keywords, extract_keywords
+from typing import Optional
+from database import get_user, get_message_page, get_session, get_messages, list_sessions
+from context import build_history, remember_turn, estimate_tokens, MODEL_FOR_CHOICE
+from prompts import render_for_user
+from response_cache import response_cache, RESPONSE_CACHE_ENABLED
+from utils import detect_crisis_keywords
+from topics import topic_pipeline
+from sessions import session_manager
+from summarizer import session_summarizer, session_summary, unsummarized
+from metrics import stage
+from llm_client import get_llm_client, ProviderError, ProviderNotConfigured
+from provider_router import ProviderRouter
+from security import current_user_id, ensure_owner, authorize_user
+from rate_limit import rate_limiter, RateLimitExceeded, RATE_LIMIT_ENABLED, too_many_requests
+import asyncio
 import os
-import requests
+import json
+import time
 from datetime import datetime
 
 router = APIRouter()
@@ -14,131 +28,540 @@ class ChatRequest(BaseModel):
     user_id: str
     message: str
     model_choice: str = "groq"
+    use_cache: bool = True  # set False to always get a fresh reply
 
 
 # --- LLM Callers ---
+# `history` is the packed list of earlier turns from context.build_history():
+# [{"role": "user" | "assistant", "content": str}, ...] oldest first.
 
 
-def call_groq(system_prompt, user_message):
+def openai_messages(system_prompt, user_message, history=None):
+    return (
+        [{"role": "system", "content": system_prompt}]
+        + list(history or [])
+        + [{"role": "user", "content": user_message}]
+    )
+
+
+def gemini_contents(system_prompt, user_message, history=None):
+    # Gemini has no system role: the prompt rides on the first user part
+    # as before, and assistant turns use the "model" role.
+    contents = []
+    for turn in history or []:
+        role = "model" if turn["role"] == "assistant" else "user"
+        contents.append({"role": role, "parts": [{"text": turn["content"]}]})
+    contents.append(
+        {"role": "user", "parts": [{"text": f"{system_prompt}\n\nUser: {user_message}"}]}
+    )
+    return contents
+
+
+async def complete_groq(system_prompt, user_message, history=None):
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
-        return "Error: Groq API Key missing."
+        raise ProviderNotConfigured("groq", "Groq API Key missing.")
 
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {
         "model": "llama-3.1-8b-instant",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ],
+        "messages": openai_messages(system_prompt, user_message, history),
         "temperature": 0.7,
         "max_tokens": 300,
     }
+    data = await get_llm_client().post_json(
+        "groq", "/chat/completions", payload, headers=headers
+    )
     try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            json=payload,
-            headers=headers,
-        )
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        return f"Groq Error: {response.text}"
-    except Exception as e:
-        return f"Groq Exception: {str(e)}"
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        raise ProviderError("groq", f"Unexpected response: {data}")
 
 
-def call_gemini(system_prompt, user_message):
+async def complete_gemini(system_prompt, user_message, history=None):
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
-        return "Error: Gemini API Key missing."
+        raise ProviderNotConfigured("gemini", "Gemini API Key missing.")
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={api_key}"
+    path = f"/models/gemini-pro:generateContent?key={api_key}"
     payload = {
-        "contents": [{"parts": [{"text": f"{system_prompt}\n\nUser: {user_message}"}]}]
+        "contents": gemini_contents(system_prompt, user_message, history)
     }
+    data = await get_llm_client().post_json("gemini", path, payload)
     try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
-        return f"Gemini Error: {response.text}"
-    except Exception as e:
-        return f"Gemini Exception: {str(e)}"
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        raise ProviderError("gemini", f"Unexpected response: {data}")
 
 
-def call_chatgpt(system_prompt, user_message):
+async def complete_chatgpt(system_prompt, user_message, history=None):
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        return "Error: OpenAI API Key missing."
+        raise ProviderNotConfigured("chatgpt", "OpenAI API Key missing.")
 
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {
         "model": "gpt-3.5-turbo",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ],
+        "messages": openai_messages(system_prompt, user_message, history),
     }
+    data = await get_llm_client().post_json(
+        "chatgpt", "/chat/completions", payload, headers=headers
+    )
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions", json=payload, headers=headers
-        )
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        return f"OpenAI Error: {response.text}"
-    except Exception as e:
-        return f"OpenAI Exception: {str(e)}"
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        raise ProviderError("chatgpt", f"Unexpected response: {data}")
+
+
+# The call_* wrappers keep the old contract (errors come back as text) for
+# callers that want a single provider and no routing.
+
+
+def _error_text(label, e):
+    if isinstance(e, ProviderNotConfigured):
+        return f"Error: {e}"
+    if e.status_code:
+        return f"{label} Error: {e}"
+    return f"{label} Exception: {e}"
+
+
+async def call_groq(system_prompt, user_message, history=None):
+    try:
+        return await complete_groq(system_prompt, user_message, history)
+    except ProviderError as e:
+        return _error_text("Groq", e)
+
+
+async def call_gemini(system_prompt, user_message, history=None):
+    try:
+        return await complete_gemini(system_prompt, user_message, history)
+    except ProviderError as e:
+        return _error_text("Gemini", e)
+
+
+async def call_chatgpt(system_prompt, user_message, history=None):
+    try:
+        return await complete_chatgpt(system_prompt, user_message, history)
+    except ProviderError as e:
+        return _error_text("OpenAI", e)
+
+
+# --- Streaming LLM Callers ---
+# Each yields text fragments as the provider produces them and raises
+# ProviderError on failure.
+
+
+async def _stream_openai_compatible(provider, path, headers, payload):
+    payload = {**payload, "stream": True}
+    async for line in get_llm_client().stream_lines(
+        provider, path, payload, headers=headers
+    ):
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            break
+        try:
+            choices = json.loads(data).get("choices")
+            # Usage-only chunks carry an empty choices list
+            content = (choices[0].get("delta") or {}).get("content") if choices else None
+        except (ValueError, LookupError, AttributeError, TypeError) as e:
+            raise ProviderError(provider, f"Malformed stream chunk: {e}")
+        if content:
+            yield content
+
+
+async def stream_groq(system_prompt, user_message, history=None):
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ProviderNotConfigured("groq", "Groq API Key missing.")
+
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": "llama-3.1-8b-instant",
+        "messages": openai_messages(system_prompt, user_message, history),
+        "temperature": 0.7,
+        "max_tokens": 300,
+    }
+    async for token in _stream_openai_compatible(
+        "groq", "/chat/completions", headers, payload
+    ):
+        yield token
+
+
+async def stream_chatgpt(system_prompt, user_message, history=None):
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ProviderNotConfigured("chatgpt", "OpenAI API Key missing.")
+
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": "gpt-3.5-turbo",
+        "messages": openai_messages(system_prompt, user_message, history),
+    }
+    async for token in _stream_openai_compatible(
+        "chatgpt", "/chat/completions", headers, payload
+    ):
+        yield token
+
+
+async def stream_gemini(system_prompt, user_message, history=None):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ProviderNotConfigured("gemini", "Gemini API Key missing.")
+
+    # alt=sse makes streamGenerateContent emit one "data:" line per chunk
+    path = f"/models/gemini-pro:streamGenerateContent?alt=sse&key={api_key}"
+    payload = {
+        "contents": gemini_contents(system_prompt, user_message, history)
+    }
+    async for line in get_llm_client().stream_lines("gemini", path, payload):
+        if not line.startswith("data:"):
+            continue
+        try:
+            chunk = json.loads(line[len("data:") :].strip())
+            texts = [
+                part.get("text")
+                for candidate in chunk.get("candidates", [])
+                for part in candidate.get("content", {}).get("parts", [])
+            ]
+        except (ValueError, AttributeError, TypeError) as e:
+            raise ProviderError("gemini", f"Malformed stream chunk: {e}")
+        for text in texts:
+            if text:
+                yield text
+
+
+# Failover / hedging / circuit breaking across the three providers
+provider_router = ProviderRouter(
+    {"groq": complete_groq, "gemini": complete_gemini, "chatgpt": complete_chatgpt},
+    streamers={"groq": stream_groq, "gemini": stream_gemini, "chatgpt": stream_chatgpt},
+)
+
+PROVIDERS_UNAVAILABLE = "All AI providers are unavailable right now. Please try again shortly."
 
 
 # --- Endpoint ---
 
 
-@router.post("/")
-async def chat(request: ChatRequest):
-    # 1. Crisis Detection
-    if detect_crisis_keywords(request.message):
-        return {
-            "response": "I'm really glad you told me this. That feeling is real, but you don't have to go through it alone.",
-            "is_crisis": True,
-            "helplines": {
-                "AMICA": "1800-300-0019",
-                "iCall": "1800-389-5146",
-                "VANDREVALA": "1860-2662-345",
-            },
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-
-    # 2. Load User Context
-    user = await get_user(request.user_id)
-    user_name = user.get("name", "Friend") if user else "Friend"
-    keywords = await get_user_keywords(request.user_id)
-    context_str = ", ".join(keywords)
-
-    # 3. Build Prompt
-    system_prompt = get_system_prompt(user_name, context_str)
-
-    # 4. Call LLM
-    if request.model_choice == "gemini":
-        response_text = call_gemini(system_prompt, request.message)
-    elif request.model_choice == "chatgpt":
-        response_text = call_chatgpt(system_prompt, request.message)
-    else:
-        response_text = call_groq(system_prompt, request.message)
-
-    # 5. Save Conversation
-    await save_message(
-        request.user_id,
-        {"type": "user", "content": request.message, "model": request.model_choice},
+def crisis_response():
+    return {
+        "response": "I'm really glad you told me this. That feeling is real, but you don't have to go through it alone.",
+        "is_crisis": True,
+        "helplines": {
+            "AMICA": "1800-300-0019",
+            "iCall": "1800-389-5146",
+            "VANDREVALA": "1860-2662-345",
+        },
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+async def build_system_prompt(user_id: str):
+    # Returns (prompt, user_name, topics, session); prompt is a prompts.RenderedPrompt
+    with stage("profile_load"):
+        user, session = await asyncio.gather(
+            get_user(user_id), session_manager.current(user_id)
+        )
+    with stage("prompt_build"):
+        user_name = user.get("name", "Friend") if user else "Friend"
+        keywords = user.get("keywords", []) if user else []
+        context_str = ", ".join(keywords)
+        prompt = render_for_user(
+            user_id, user_name, context_str, user, session_summary(session)
+        )
+        return prompt, user_name, context_str, session
+
+
+async def load_history(request: ChatRequest, prompt, session: dict):
+    # Turns already folded into the session summary are left out
+    with stage("history_load"):
+        return await build_history(
+            request.user_id,
+            session["session_id"],
+            MODEL_FOR_CHOICE.get(request.model_choice, "llama-3.1-8b-instant"),
+            prompt.tokens + estimate_tokens(request.message),
+            latest=unsummarized(session) if session.get("summarized_count") else None,
+        )
+
+
+def response_cache_key(request: ChatRequest, history, prompt, topics: str = ""):
+    # Only first turns are cached: later replies depend on the conversation.
+    # The user's topics are part of the prompt, so they are part of the key:
+    # a reply that mentions one user's topics is never served to another.
+    # The template hash keeps A/B prompt versions from sharing replies.
+    # A prompt carrying a conversation summary is personal, so never cached.
+    if not (RESPONSE_CACHE_ENABLED and request.use_cache) or history or prompt.has_summary:
+        return None
+    return response_cache.make_key(
+        request.model_choice, f"{prompt.template_hash}|{topics}", request.message
     )
-    await save_message(
-        request.user_id,
-        {"type": "ai", "content": response_text, "model": request.model_choice},
+
+
+async def admit_chat(request: ChatRequest, token_user_id=Depends(current_user_id)):
+    # The caller must own the user_id before it can spend that user's tokens.
+    # Then per-user and per-provider token buckets. Crisis messages are never
+    # throttled: the helpline reply must always go out.
+    ensure_owner(token_user_id, request.user_id)
+    if not RATE_LIMIT_ENABLED or detect_crisis_keywords(request.message):
+        return
+    try:
+        with stage("admission"):
+            await rate_limiter.admit(request.user_id, request.model_choice)
+    except RateLimitExceeded as e:
+        print(f"🚦 Throttled {request.user_id} ({e.scope})")
+        raise too_many_requests(e)
+
+
+async def acquire_llm_slot():
+    try:
+        await rate_limiter.acquire_slot()
+    except RateLimitExceeded as e:
+        raise too_many_requests(e)
+
+
+async def save_turn(
+    request: ChatRequest,
+    session: dict,
+    response_text: str,
+    received_at: str,
+    model: str = None,
+):
+    model = model or request.model_choice
+    try:
+        with stage("persist"):
+            await session_manager.save_turn(
+                request.user_id,
+                session,
+                [
+                    {
+                        "type": "user",
+                        "content": request.message,
+                        "model": model,
+                        "timestamp": received_at,
+                    },
+                    {"type": "ai", "content": response_text, "model": model},
+                ],
+            )
+        session_summarizer.submit(request.user_id, session)
+    except Exception as e:
+        # Runs after the response is sent; nothing left to report the error to
+        print(f"❌ Failed to save conversation for {request.user_id}: {e}")
+
+
+@router.post("/", dependencies=[Depends(admit_chat)])
+async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+    received_at = datetime.utcnow().isoformat()
+
+    # 1. Crisis Detection
+    with stage("crisis_check"):
+        is_crisis = detect_crisis_keywords(request.message)
+    if is_crisis:
+        return crisis_response()
+
+    # 2. Load User Context + 3. Build Prompt
+    prompt, user_name, topics, session = await build_system_prompt(request.user_id)
+    history = await load_history(request, prompt, session)
+
+    # 4. Call LLM (or reuse a cached reply to the same / a near-identical opener)
+    cache_key = response_cache_key(request, history, prompt, topics)
+    with stage("cache_lookup"):
+        response_text = response_cache.lookup(cache_key, user_name) if cache_key else None
+    cached = response_text is not None
+    model = request.model_choice
+    if not cached:
+        await acquire_llm_slot()
+        started = time.perf_counter()
+        try:
+            with stage("llm"):
+                response_text, model = await provider_router.complete(
+                    request.model_choice, prompt.text, request.message, history
+                )
+        except ProviderError as e:
+            print(f"❌ Chat failed for {request.user_id}: {e}")
+            raise HTTPException(status_code=503, detail=PROVIDERS_UNAVAILABLE)
+        finally:
+            rate_limiter.release_slot()
+        if cache_key:
+            response_cache.store(
+                cache_key, response_text, user_name, time.perf_counter() - started
+            )
+
+    await remember_turn(
+        request.user_id, session["session_id"], request.message, response_text
     )
 
-    # 6. Extract & Update Keywords (Simple implementation)
-    # In real app, we'd update the user profile with new keywords
+    # 5. Save Conversation (one batched write, after the response is sent)
+    background_tasks.add_task(save_turn, request, session, response_text, received_at, model)
+
+    # 6. Extract & Update Keywords (background: topics.py, flushed in batches)
+    topic_pipeline.submit(request.user_id, request.message)
 
     return {
         "response": response_text,
         "is_crisis": False,
+        "cached": cached,
+        "model": model,
         "timestamp": datetime.utcnow().isoformat(),
     }
+
+
+def sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+class SlotStreamingResponse(StreamingResponse):
+    # Runs on_close once the response is over however it ended: streamed to
+    # the end, cut short by a disconnect, or never started because the
+    # client was gone before Starlette began iterating the body (in which
+    # case the generator's own finally never runs).
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+@router.post("/stream", dependencies=[Depends(admit_chat)])
+async def chat_stream(request: ChatRequest):
+    # Same pipeline as POST /chat, but tokens are relayed as Server-Sent Events:
+    #   data: {"token": "..."}                       (repeated)
+    #   data: {"done": true, "is_crisis": false, ...} (final)
+    # The turn is persisted once, after the last token.
+    received_at = datetime.utcnow().isoformat()
+    with stage("crisis_check"):
+        is_crisis = detect_crisis_keywords(request.message)
+    if is_crisis:
+        payload = crisis_response()
+
+        async def crisis_events():
+            yield sse_event({**payload, "done": True})
+
+        return StreamingResponse(crisis_events(), media_type="text/event-stream")
+
+    prompt, user_name, topics, session = await build_system_prompt(request.user_id)
+    history = await load_history(request, prompt, session)
+
+    cache_key = response_cache_key(request, history, prompt, topics)
+    with stage("cache_lookup"):
+        cached_text = response_cache.lookup(cache_key, user_name) if cache_key else None
+    if cached_text is not None:
+        # Cache hit: the whole reply goes out as a single token event
+        async def cached_events():
+            await remember_turn(
+                request.user_id, session["session_id"], request.message, cached_text
+            )
+            await save_turn(request, session, cached_text, received_at)
+            topic_pipeline.submit(request.user_id, request.message)
+            yield sse_event({"token": cached_text})
+            yield sse_event(
+                {
+                    "done": True,
+                    "is_crisis": False,
+                    "cached": True,
+                    "timestamp": datetime.utcnow().isoformat(),
+                }
+            )
+
+        return StreamingResponse(
+            cached_events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    # The in-flight slot is held until the last token has been relayed
+    await acquire_llm_slot()
+    started = time.perf_counter()
+    try:
+        # Fails over between providers until one produces its first token
+        with stage("llm_first_token"):
+            model, tokens = await provider_router.open_stream(
+                request.model_choice, prompt.text, request.message, history
+            )
+    except BaseException as e:
+        rate_limiter.release_slot()
+        if not isinstance(e, ProviderError):
+            raise
+        print(f"❌ Chat stream failed for {request.user_id}: {e}")
+        raise HTTPException(status_code=503, detail=PROVIDERS_UNAVAILABLE)
+
+    released = False
+
+    async def release():
+        # Idempotent: called when the tokens run out and again when the response closes
+        nonlocal released
+        if not released:
+            released = True
+            rate_limiter.release_slot()
+            await tokens.aclose()
+
+    async def events():
+        parts = []
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+        except ProviderError as e:
+            yield sse_event({"error": str(e), "provider": e.provider, "done": True})
+            return
+        finally:
+            await release()
+
+        response_text = "".join(parts)
+        if cache_key:
+            response_cache.store(
+                cache_key, response_text, user_name, time.perf_counter() - started
+            )
+        await remember_turn(
+            request.user_id, session["session_id"], request.message, response_text
+        )
+        await save_turn(request, session, response_text, received_at, model)
+        topic_pipeline.submit(request.user_id, request.message)
+        yield sse_event(
+            {
+                "done": True,
+                "is_crisis": False,
+                "cached": False,
+                "model": model,
+                "timestamp": datetime.utcnow().isoformat(),
+            }
+        )
+
+    return SlotStreamingResponse(
+        events(),
+        on_close=release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/history/{user_id}", dependencies=[Depends(authorize_user)])
+async def chat_history(
+    user_id: str, cursor: Optional[str] = None, limit: int = Query(20, ge=1, le=100)
+):
+    # Newest page first; follow next_cursor to page backwards through older sessions
+    messages, next_cursor = await get_message_page(user_id, cursor=cursor, limit=limit)
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+@router.get("/sessions/{user_id}", dependencies=[Depends(authorize_user)])
+async def chat_sessions(
+    user_id: str, before: Optional[str] = None, limit: int = Query(20, ge=1, le=100)
+):
+    # Session metadata only (one small doc per session); newest first
+    sessions = await list_sessions(user_id, limit=limit, before=before)
+    next_before = sessions[-1]["session_id"] if len(sessions) == limit else None
+    return {"sessions": sessions, "next_before": next_before}
+
+
+@router.get("/sessions/{user_id}/{session_id}", dependencies=[Depends(authorize_user)])
+async def chat_session(user_id: str, session_id: str, limit: int = Query(20, ge=1, le=100)):
+    session = await get_session(user_id, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    messages = await get_messages(user_id, session_id, limit=limit)
+    return {"session": session, "messages": messages}
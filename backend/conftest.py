@@ -0,0 +1,9 @@
+import os
+
+# Tests run against the in-memory Firestore and auth fakes, with cheap bcrypt
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("BCRYPT_MAX_WORKERS", "1")
+
+# Manual check against a real Firebase project, not a unit test
+collect_ignore = ["test_firebase.py"]
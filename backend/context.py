@@ -0,0 +1,99 @@
+import os
+from collections import deque
+from cache import TTLCache, MISSING
+from database import get_messages
+
+# Conversation memory for the LLM calls.
+# Recent turns of the current session live in a per-session ring buffer, so
+# Firestore is only read on the first turn a worker sees (or after the buffer
+# expires). Before each call the buffer is packed newest-first into the
+# model's token budget, which keeps prompt size bounded however long the chat.
+
+MODEL_FOR_CHOICE = {
+    "groq": "llama-3.1-8b-instant",
+    "chatgpt": "gpt-3.5-turbo",
+    "gemini": "gemini-pro",
+}
+
+# Tokens reserved for history; the system prompt and reply come on top
+CONTEXT_BUDGETS = {
+    "llama-3.1-8b-instant": int(os.getenv("CONTEXT_BUDGET_GROQ", "1500")),
+    "gpt-3.5-turbo": int(os.getenv("CONTEXT_BUDGET_OPENAI", "1500")),
+    "gemini-pro": int(os.getenv("CONTEXT_BUDGET_GEMINI", "3000")),
+}
+
+# Model context windows, and the reply length the callers ask for (max_tokens).
+# The history budget shrinks if the system prompt would otherwise overflow.
+CONTEXT_WINDOWS = {
+    "llama-3.1-8b-instant": 8192,
+    "gpt-3.5-turbo": 16385,
+    "gemini-pro": 30720,
+}
+REPLY_TOKENS = 300
+
+RING_SIZE = int(os.getenv("CONTEXT_RING_SIZE", "20"))
+
+_ring_buffers = TTLCache(
+    maxsize=int(os.getenv("CONTEXT_MAX_SESSIONS", "5000")),
+    ttl=float(os.getenv("CONTEXT_SESSION_TTL", "1800")),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def _to_turn(message: dict) -> dict:
+    role = "assistant" if message.get("type") == "ai" else "user"
+    return {"role": role, "content": message.get("content", "")}
+
+
+async def _ring_buffer(user_id: str, session_id: str) -> deque:
+    key = (user_id, session_id)
+    ring = _ring_buffers.get(key)
+    if ring is MISSING:
+        messages = await get_messages(user_id, session_id, limit=RING_SIZE)
+        ring = deque((_to_turn(m) for m in messages), maxlen=RING_SIZE)
+        _ring_buffers.set(key, ring)
+    return ring
+
+
+def history_budget(model: str, prompt_tokens: int = 0) -> int:
+    budget = CONTEXT_BUDGETS.get(model, 1500)
+    window = CONTEXT_WINDOWS.get(model)
+    if window:
+        budget = min(budget, window - prompt_tokens - REPLY_TOKENS)
+    return max(0, budget)
+
+
+def pack_history(turns, model: str, budget: int = None) -> list:
+    # Walk newest-first, stop at the first turn that doesn't fit
+    budget = CONTEXT_BUDGETS.get(model, 1500) if budget is None else budget
+    packed = []
+    used = 0
+    for turn in reversed(turns):
+        cost = estimate_tokens(turn["content"])
+        if used + cost > budget:
+            break
+        packed.append(turn)
+        used += cost
+    packed.reverse()
+    return packed
+
+
+async def build_history(
+    user_id: str, session_id: str, model: str, prompt_tokens: int = 0, latest: int = None
+) -> list:
+    # prompt_tokens: system prompt + user message, from the template's token counts
+    # latest: only consider this many newest messages (the rest are summarized)
+    turns = list(await _ring_buffer(user_id, session_id))
+    if latest is not None:
+        turns = turns[-latest:] if latest > 0 else []
+    return pack_history(turns, model, history_budget(model, prompt_tokens))
+
+
+async def remember_turn(user_id: str, session_id: str, user_message: str, ai_message: str):
+    ring = await _ring_buffer(user_id, session_id)
+    ring.append({"role": "user", "content": user_message})
+    ring.append({"role": "assistant", "content": ai_message})
@@ -1,115 +1,599 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import asyncio
+import contextvars
+import copy
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+import time
+from cache import TTLCache, MISSING
+from metrics import observe_firestore_op
+
+# Firestore client
+# Created on first use (or at startup by the app lifespan), not at import
+# time: importing this module needs no credentials and doesn't pay for the
+# Firebase/Firestore SDK imports. set_db() injects a client (tests, scripts).
+# FIRESTORE_BACKEND=memory swaps in the in-memory fake (local runs, load tests),
+# FIRESTORE_EMULATOR_HOST talks to the Firestore emulator without credentials.
+FIRESTORE_BACKEND = os.getenv("FIRESTORE_BACKEND", "firebase")
+
+# Same values as firestore.Query.ASCENDING / DESCENDING
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+_db = None
+
+
+def _create_client():
+    if FIRESTORE_BACKEND == "memory":
+        from fake_firestore import FakeFirestoreClient
+
+        print("🧪 Using in-memory Firestore fake")
+        return FakeFirestoreClient()
+
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        from google.cloud import firestore as gcloud_firestore
+
+        print(f"🧪 Using Firestore emulator at {os.getenv('FIRESTORE_EMULATOR_HOST')}")
+        return gcloud_firestore.Client(project=os.getenv("FIREBASE_PROJECT_ID", "mindmate-dev"))
+
+    # STRICT MODE: Only load from FIREBASE_CREDENTIALS_JSON env var (Railway/Render friendly)
+    firebase_json = os.getenv("FIREBASE_CREDENTIALS_JSON")
+
+    if not firebase_json:
+        # Fail loudly if credentials are missing
+        print("❌ Runtime Error: FIREBASE_CREDENTIALS_JSON environment variable not set.")
+        print("   Please set this variable with the content of your serviceAccountKey.json.")
+        raise RuntimeError("FIREBASE_CREDENTIALS_JSON not set")
+
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        # Handle potential double-escaped newlines
+        if "\\n" in firebase_json:
+            firebase_json = firebase_json.replace("\\n", "\n")
+
+        cred_dict = json.loads(firebase_json)
+        cred = credentials.Certificate(cred_dict)
+        firebase_admin.initialize_app(cred)
+        client = firestore.client()
+        print("✅ Firebase initialized successfully from environment variable")
+        return client
+    except Exception as e:
+        print(f"❌ Failed to initialize Firebase: {e}")
+        raise e
+
+
+def get_db():
+    global _db
+    if _db is None:
+        _db = _create_client()
+    return _db
+
+
+def set_db(client):
+    global _db
+    _db = client
+
+
+# The Firestore client is synchronous; every round trip runs on this bounded
+# pool so the event loop keeps serving other requests while we wait.
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "16"))
+_executor = ThreadPoolExecutor(
+    max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore"
+)
+
+
+def _timed(fn, *args, **kwargs):
+    # Runs on the executor; the op label is the function name
+    # (commit, get, set, query, get_all, ...)
+    op = _OP_NAMES.get(fn.__name__, fn.__name__.lstrip("_"))
+    start = time.perf_counter()
+    ok = False
+    try:
+        result = fn(*args, **kwargs)
+        ok = True
+        return result
+    finally:
+        observe_firestore_op(op, time.perf_counter() - start, ok)
+
+
+async def run_db(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(_timed, fn, *args, **kwargs)
+    )
+
 
-if os.getenv("ENVIRONMENT") != "production":
-    from dotenv import load_dotenv
-    load_dotenv()
-
-# Initialize Firebase
-# STRICT MODE: Only load from FIREBASE_CREDENTIALS_JSON env var (Railway/Render friendly)
-firebase_json = os.getenv("FIREBASE_CREDENTIALS_JSON")
-
-if not firebase_json:
-    # Fail loudly if credentials are missing
-    print("❌ Runtime Error: FIREBASE_CREDENTIALS_JSON environment variable not set.")
-    print("   Please set this variable with the content of your serviceAccountKey.json.")
-    raise RuntimeError("FIREBASE_CREDENTIALS_JSON not set")
-
-try:
-    # Handle potential double-escaped newlines
-    if "\\n" in firebase_json:
-        firebase_json = firebase_json.replace("\\n", "\n")
-        
-    cred_dict = json.loads(firebase_json)
-    cred = credentials.Certificate(cred_dict)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("✅ Firebase initialized successfully from environment variable")
-except Exception as e:
-    print(f"❌ Failed to initialize Firebase: {e}")
-    raise e
+def _fetch_dicts(query):
+    # Streams and materializes a query in one executor hop
+    return [doc.to_dict() for doc in query.stream()]
+
+
+def _get_all(db, refs):
+    return list(db.get_all(refs))
+
+
+_OP_NAMES = {"_fetch_dicts": "query", "_read_message_page": "message_page"}
+
+
+# --- Read Coalescing ---
+
+
+# A dashboard load fires /chat, /user/{id}/profile and /mood/week/{id} at
+# once, and they all read the same few documents. Reads go through this layer:
+#   - identical reads already in flight share one result (single-flight);
+#   - distinct document reads requested in the same event-loop tick are
+#     fetched together with one db.get_all() (dataloader-style batching).
+# Writes through this module drop the user's in-flight entries, so a read that
+# starts after a write never joins one that started before it.
+COALESCE_READS = os.getenv("FIRESTORE_COALESCE_READS", "true").lower() == "true"
+
+
+class ReadCoalescer:
+    def __init__(self):
+        self._loop = None
+        self._inflight = {}
+        self._pending = {}
+        self._tasks = set()
+        self.requested = 0
+        self.coalesced = 0
+        self.round_trips = 0
+        self.largest_batch = 0
+
+    def _bind(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._inflight, self._pending = loop, {}, {}
+        return loop
+
+    async def _join(self, key):
+        self.coalesced += 1
+        return copy.deepcopy(await asyncio.shield(self._inflight[key]))
+
+    def _finish(self, key, future, result=None, error=None):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            future.exception()  # mark retrieved: nobody may be waiting any more
+        else:
+            future.set_result(result)
+
+    async def get_document(self, ref):
+        # Document as a dict (None if it doesn't exist)
+        loop = self._bind()
+        self.requested += 1
+        key = ("doc", ref.path)
+        if key in self._inflight:
+            return await self._join(key)
+        future = loop.create_future()
+        self._inflight[key] = future
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending[key] = (ref, future)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._fetch_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_batch(self, batch):
+        refs = [ref for ref, _ in batch.values()]
+        self.round_trips += 1
+        self.largest_batch = max(self.largest_batch, len(refs))
+        try:
+            snapshots = await run_db(_get_all, get_db(), refs)
+        except Exception as e:
+            for key, (_, future) in batch.items():
+                self._finish(key, future, error=e)
+            return
+        # get_all doesn't promise to return documents in request order
+        found = {snap.reference.path: snap for snap in snapshots}
+        for key, (ref, future) in batch.items():
+            snap = found.get(ref.path)
+            self._finish(key, future, snap.to_dict() if snap and snap.exists else None)
+
+    async def single_flight(self, key, fn, *args):
+        # Runs fn(*args) on the executor unless an identical call is in flight
+        loop = self._bind()
+        self.requested += 1
+        if key in self._inflight:
+            return await self._join(key)
+        future = loop.create_future()
+        self._inflight[key] = future
+        self.round_trips += 1
+        try:
+            result = await run_db(fn, *args)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, copy.deepcopy(result))
+        return result
+
+    def forget_user(self, user_id: str):
+        prefix = f"users/{user_id}"
+        for key in list(self._inflight):
+            owner = key[1]
+            if owner == user_id or owner == prefix or owner.startswith(prefix + "/"):
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": COALESCE_READS,
+            "reads_requested": self.requested,
+            "coalesced": self.coalesced,
+            "round_trips": self.round_trips,
+            "round_trips_saved": self.requested - self.round_trips,
+            "largest_batch": self.largest_batch,
+        }
+
+
+_reads = ReadCoalescer()
+
+
+def get_read_stats() -> dict:
+    return _reads.stats()
+
+
+async def _get_documents(refs: list) -> list:
+    # Documents as dicts in `refs` order (None where missing)
+    if COALESCE_READS:
+        return list(await asyncio.gather(*(_reads.get_document(ref) for ref in refs)))
+    db = get_db()
+    snapshots = await run_db(_get_all, db, refs)
+    found = {snap.reference.path: snap for snap in snapshots}
+    return [
+        found[ref.path].to_dict() if ref.path in found and found[ref.path].exists else None
+        for ref in refs
+    ]
+
+
+async def _query_dicts(key, query):
+    if COALESCE_READS:
+        return await _reads.single_flight(key, _fetch_dicts, query)
+    return await run_db(_fetch_dicts, query)
 
 
 # --- User Operations ---
 
 
+# Profile reads are the most frequent Firestore operation, so they go through
+# two cache layers:
+#   - a request scope (contextvar dict set up per HTTP request in main.py), so a
+#     request never reads the same profile twice;
+#   - a process-wide TTL/LRU cache. Writes through this module invalidate it;
+#     other workers may serve a stale profile for up to PROFILE_CACHE_TTL seconds.
+# Each invalidation stamps the user with a new version, and a read only fills
+# the cache if no invalidation happened while it was in flight; otherwise a
+# read that raced an update would cache the pre-update document.
+_profile_cache = TTLCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "60")),
+)
+_profile_versions = TTLCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")), ttl=3600
+)
+_version_counter = count(1)
+_request_profiles = contextvars.ContextVar("request_profiles", default=None)
+_request_scope_hits = 0
+
+
+def begin_request_scope():
+    return _request_profiles.set({})
+
+
+def end_request_scope(token):
+    _request_profiles.reset(token)
+
+
+def invalidate_user_cache(user_id: str):
+    _profile_versions.set(user_id, next(_version_counter))
+    _profile_cache.delete(user_id)
+    _reads.forget_user(user_id)
+    scope = _request_profiles.get()
+    if scope is not None:
+        scope.pop(user_id, None)
+
+
+def get_profile_cache_stats() -> dict:
+    stats = _profile_cache.stats()
+    stats["request_scope_hits"] = _request_scope_hits
+    return stats
+
+
 async def create_user(user_id: str, user_data: dict):
-    if not db:
-        return
+    db = get_db()
     user_data["created_at"] = datetime.utcnow().isoformat()
-    db.collection("users").document(user_id).set(user_data)
+    await run_db(db.collection("users").document(user_id).set, user_data)
+    invalidate_user_cache(user_id)
 
 
 async def get_user(user_id: str):
-    if not db:
-        return None
-    doc = db.collection("users").document(user_id).get()
-    if doc.exists:
-        return doc.to_dict()
-    return None
+    global _request_scope_hits
+    db = get_db()
+
+    scope = _request_profiles.get()
+    if scope is not None and user_id in scope:
+        _request_scope_hits += 1
+        return copy.deepcopy(scope[user_id])
+
+    user = _profile_cache.get(user_id)
+    if user is MISSING:
+        version = _profile_versions.get(user_id, 0)
+        (user,) = await _get_documents([db.collection("users").document(user_id)])
+        if _profile_versions.get(user_id, 0) != version:
+            # Updated while we were reading: serve this read, cache nothing
+            return copy.deepcopy(user)
+        _profile_cache.set(user_id, user)
+
+    if scope is not None:
+        scope[user_id] = user
+    return copy.deepcopy(user)
 
 
 async def update_user(user_id: str, data: dict):
-    if not db:
-        return
-    db.collection("users").document(user_id).update(data)
+    db = get_db()
+    await _ensure_writable(user_id)
+    try:
+        await run_db(db.collection("users").document(user_id).update, data)
+    finally:
+        invalidate_user_cache(user_id)
+
+
+async def save_user_topics(updates: dict):
+    # {user_id: fields} merged into many profiles at once; Firestore batches
+    # hold at most 500 writes. Deleted accounts are skipped.
+    db = get_db()
+    deleted = await asyncio.gather(*(is_user_deleted(user_id) for user_id in updates))
+    user_ids = [user_id for user_id, gone in zip(updates, deleted) if not gone]
+    try:
+        for i in range(0, len(user_ids), 400):
+            batch = db.batch()
+            for user_id in user_ids[i : i + 400]:
+                batch.set(db.collection("users").document(user_id), updates[user_id], merge=True)
+            await run_db(batch.commit)
+    finally:
+        for user_id in user_ids:
+            invalidate_user_cache(user_id)
 
 
 async def delete_user(user_id: str):
-    if not db:
-        return
-    db.collection("users").document(user_id).delete()
+    db = get_db()
+    await run_db(db.collection("users").document(user_id).delete)
+    await run_db(db.collection("credentials").document(user_id).delete)
+    invalidate_user_cache(user_id)
+
+
+# Password hashes live in credentials/{id}, outside the profile document, so
+# they never reach profile responses, caches or exports.
+async def get_password_hash(user_id: str):
+    db = get_db()
+    [credentials] = await _get_documents([db.collection("credentials").document(user_id)])
+    return (credentials or {}).get("password_hash")
+
+
+async def save_password_hash(user_id: str, password_hash: str):
+    db = get_db()
+    await _ensure_writable(user_id)
+    await run_db(
+        db.collection("credentials").document(user_id).set,
+        {"password_hash": password_hash, "updated_at": datetime.utcnow().isoformat()},
+        merge=True,
+    )
 
 
 # --- Chat Operations ---
 
 
-async def save_message(user_id: str, message_data: dict):
-    if not db:
-        return
-    # We'll store messages in a subcollection 'messages' under the user
-    # Or a separate 'conversations' collection. Let's follow the prompt schema:
-    # users/{user_id}/conversations/{session_id}/messages/{msg_id}
+# Sessions are opened and closed by sessions.py; each one has a metadata doc
+# users/{id}/conversations/{session_id} (started_at, last_activity,
+# message_count, time_zone, local_date, summary) next to its messages.
+# Session ids are UTC start times, so they sort chronologically (after the
+# older per-day "YYYY-MM-DD" ids).
+
+
+def _conversations(db, user_id: str):
+    return db.collection("users").document(user_id).collection("conversations")
+
+
+def _session_update(session_id: str, timestamp: str, count: int, fields: dict = None) -> dict:
+    from google.cloud.firestore_v1 import Increment
 
-    # For MVP simplicity, let's just use a single 'history' collection or append to a list
-    # But prompt says: users/{user_id}/conversations/{session_id}/messages/
+    return {
+        **(fields or {}),
+        "session_id": session_id,
+        "last_activity": timestamp,
+        "message_count": Increment(count),
+    }
 
-    # We need a session ID. For now, let's assume a 'default' session or generate one based on date
-    session_id = datetime.now().strftime("%Y-%m-%d")
 
-    # Add timestamp
+async def save_message(user_id: str, message_data: dict, session_id: str):
+    db = get_db()
+    await _ensure_writable(user_id)
+    # users/{user_id}/conversations/{session_id}/messages/{msg_id}
     message_data["timestamp"] = datetime.utcnow().isoformat()
 
-    db.collection("users").document(user_id).collection("conversations").document(
-        session_id
-    ).collection("messages").add(message_data)
+    conversation_ref = _conversations(db, user_id).document(session_id)
+    batch = db.batch()
+    batch.set(conversation_ref.collection("messages").document(), message_data)
+    batch.set(
+        conversation_ref,
+        _session_update(session_id, message_data["timestamp"], 1),
+        merge=True,
+    )
+    await run_db(batch.commit)
+
+
+async def append_conversation_turn(
+    user_id: str,
+    messages: list,
+    keywords: list = None,
+    session_id: str = None,
+    session_fields: dict = None,
+):
+    # Persists a whole chat turn (user + AI message, optionally the updated
+    # profile keywords) in one WriteBatch: one round trip instead of one per write.
+    # session_fields are merged into the session's metadata doc.
+    db = get_db()
+    await _ensure_writable(user_id)
+    user_ref = db.collection("users").document(user_id)
+    conversation_ref = user_ref.collection("conversations").document(session_id)
+    messages_ref = conversation_ref.collection("messages")
+
+    batch = db.batch()
+    for message_data in messages:
+        message_data.setdefault("timestamp", datetime.utcnow().isoformat())
+        batch.set(messages_ref.document(), message_data)
+    batch.set(
+        conversation_ref,
+        _session_update(session_id, messages[-1]["timestamp"], len(messages), session_fields),
+        merge=True,
+    )
+    if keywords is not None:
+        batch.set(user_ref, {"keywords": keywords}, merge=True)
+
+    try:
+        await run_db(batch.commit)
+    finally:
+        if keywords is not None:
+            invalidate_user_cache(user_id)
 
 
-async def get_messages(user_id: str, limit: int = 10):
-    if not db:
-        return []
-    session_id = datetime.now().strftime("%Y-%m-%d")
+async def get_session(user_id: str, session_id: str):
+    # One document read: the session's metadata, or None
+    db = get_db()
+    [session] = await _get_documents([_conversations(db, user_id).document(session_id)])
+    return session
 
-    docs = (
-        db.collection("users")
-        .document(user_id)
-        .collection("conversations")
+
+async def get_latest_session(user_id: str):
+    db = get_db()
+    query = _conversations(db, user_id).order_by("session_id", direction=DESCENDING).limit(1)
+    sessions = await _query_dicts(("latest_session", user_id), query)
+    return sessions[0] if sessions else None
+
+
+async def list_sessions(user_id: str, limit: int = 20, before: str = None) -> list:
+    # Newest first; pass the last session_id back as `before` for older ones
+    from google.cloud.firestore_v1 import FieldFilter
+
+    db = get_db()
+    query = _conversations(db, user_id).order_by("session_id", direction=DESCENDING)
+    if before:
+        query = query.where(filter=FieldFilter("session_id", "<", before))
+    return await _query_dicts(("sessions", user_id, limit, before), query.limit(limit))
+
+
+async def update_session(user_id: str, session_id: str, data: dict):
+    db = get_db()
+    await _ensure_writable(user_id)
+    await run_db(
+        _conversations(db, user_id).document(session_id).set, data, merge=True
+    )
+
+
+async def get_messages(user_id: str, session_id: str, limit: int = 10):
+    # Newest `limit` messages of a session, returned oldest first
+    db = get_db()
+    query = (
+        _conversations(db, user_id)
         .document(session_id)
         .collection("messages")
-        .order_by("timestamp", direction=firestore.Query.ASCENDING)
+        .order_by("timestamp", direction=DESCENDING)
         .limit(limit)
-        .stream()
     )
 
-    return [doc.to_dict() for doc in docs]
+    messages = await run_db(_fetch_dicts, query)
+    messages.reverse()
+    return messages
+
+
+async def get_messages_after(user_id: str, session_id: str, after: str = None, limit: int = 20):
+    # Oldest-first messages of a session with timestamp > `after`
+    db = get_db()
+    query = (
+        _conversations(db, user_id)
+        .document(session_id)
+        .collection("messages")
+        .order_by("timestamp", direction=ASCENDING)
+    )
+    if after:
+        query = query.start_after({"timestamp": after})
+    return await run_db(_fetch_dicts, query.limit(limit))
+
+
+def _read_message_page(user_ref, cursor_session, cursor_timestamp, cursor_id, limit):
+    # Walks sessions newest-first and their messages newest-first, stopping as
+    # soon as the page is full, so a page costs O(limit) document reads.
+    # Messages are ordered by (timestamp, document id), so the cursor stays
+    # exact when several messages share a timestamp.
+    # Only sessions with a metadata doc are listed; backfill_sessions.py
+    # creates them for per-day sessions written before they existed.
+    from google.cloud.firestore_v1 import FieldFilter
+
+    conversations = user_ref.collection("conversations")
+    sessions = conversations.order_by(
+        "session_id", direction=DESCENDING
+    )
+    if cursor_session:
+        sessions = sessions.where(filter=FieldFilter("session_id", "<=", cursor_session))
+
+    page = []
+    for session_doc in sessions.stream():
+        session_id = session_doc.id
+        query = (
+            conversations.document(session_id)
+            .collection("messages")
+            .order_by("timestamp", direction=DESCENDING)
+            .order_by("__name__", direction=DESCENDING)
+        )
+        if session_id == cursor_session and cursor_timestamp:
+            after = {"timestamp": cursor_timestamp}
+            if cursor_id:
+                after["__name__"] = cursor_id
+            query = query.start_after(after)
+        for doc in query.limit(limit - len(page)).stream():
+            message = doc.to_dict()
+            message["session_id"] = session_id
+            page.append(message)
+            last_id = doc.id
+        if len(page) >= limit:
+            break
+
+    next_cursor = None
+    if len(page) >= limit:
+        next_cursor = f"{page[-1]['session_id']}|{page[-1]['timestamp']}|{last_id}"
+    page.reverse()
+    return page, next_cursor
+
+
+async def get_message_page(user_id: str, cursor: str = None, limit: int = 20):
+    # Paginated history across sessions. Pass the returned cursor back to get
+    # the next (older) page; a None cursor means there is nothing older.
+    db = get_db()
+    cursor_session, cursor_timestamp, cursor_id = None, None, None
+    if cursor:
+        # "session|timestamp|doc_id" (older cursors lack the doc id)
+        cursor_session, _, rest = cursor.partition("|")
+        cursor_timestamp, _, cursor_id = rest.partition("|")
+    user_ref = db.collection("users").document(user_id)
+    return await run_db(
+        _read_message_page, user_ref, cursor_session, cursor_timestamp, cursor_id, limit
+    )
 
 
 async def get_user_keywords(user_id: str):
     # In a real app, we'd query a 'keywords' field.
     # For MVP, we'll just return empty or fetch from profile if we stored them.
+    # Served from the profile cache when the profile was just loaded.
     user = await get_user(user_id)
     return user.get("keywords", []) if user else []
 
@@ -117,23 +601,342 @@ async def get_user_keywords(user_id: str):
 # --- Mood Operations ---
 
 
+def _mood_rollup_update(date: str, scores: list) -> dict:
+    # Server-side transforms keep the rollup correct under concurrent writes
+    from google.cloud.firestore_v1 import Increment, Maximum, Minimum
+
+    return {
+        "date": date,
+        "sum": Increment(sum(scores)),
+        "count": Increment(len(scores)),
+        "min": Minimum(min(scores)),
+        "max": Maximum(max(scores)),
+    }
+
+
 async def save_mood(user_id: str, mood_data: dict):
-    if not db:
-        return
+    # Writes the entry and folds it into users/{id}/mood_daily/{YYYY-MM-DD}
+    # (sum, count, min, max) in the same batch. rolled_up tells
+    # backfill_mood_rollups.py the entry is already counted.
+    db = get_db()
+    await _ensure_writable(user_id)
     mood_data["timestamp"] = datetime.utcnow().isoformat()
-    db.collection("users").document(user_id).collection("moods").add(mood_data)
+    mood_data["rolled_up"] = True
+    user_ref = db.collection("users").document(user_id)
+    date = mood_data["timestamp"][:10]
+
+    batch = db.batch()
+    batch.set(user_ref.collection("moods").document(), mood_data)
+    batch.set(
+        user_ref.collection("mood_daily").document(date),
+        _mood_rollup_update(date, [mood_data.get("mood_score", 0)]),
+        merge=True,
+    )
+    try:
+        await run_db(batch.commit)
+    finally:
+        _reads.forget_user(user_id)
 
 
-async def get_moods_week(user_id: str):
-    if not db:
-        return []
-    # In production, filter by date range. For MVP, fetch last 50 and filter in code or just return all
-    docs = (
+async def get_moods_range(user_id: str, start: str, end: str = None, limit: int = 500):
+    # Entries with start <= timestamp < end (ISO strings, UTC), newest first.
+    # Filter and sort are on the same field, so the automatic single-field
+    # index covers this query; no composite index is required.
+    from google.cloud.firestore_v1 import FieldFilter
+
+    db = get_db()
+    query = (
         db.collection("users")
         .document(user_id)
         .collection("moods")
-        .order_by("timestamp", direction=firestore.Query.DESCENDING)
-        .limit(50)
-        .stream()
+        .where(filter=FieldFilter("timestamp", ">=", start))
     )
-    return [doc.to_dict() for doc in docs]
+    if end:
+        query = query.where(filter=FieldFilter("timestamp", "<", end))
+    query = query.order_by("timestamp", direction=DESCENDING).limit(limit)
+    return await _query_dicts(("moods", user_id, start, end, limit), query)
+
+
+async def get_moods_week(user_id: str):
+    start = (datetime.utcnow() - timedelta(days=6)).strftime("%Y-%m-%d")
+    return await get_moods_range(user_id, start)
+
+
+async def get_mood_rollups(user_id: str, dates: list) -> dict:
+    # All days are fetched with one batched get_all; missing days are omitted
+    db = get_db()
+    daily = db.collection("users").document(user_id).collection("mood_daily")
+    docs = await _get_documents([daily.document(date) for date in dates])
+    return {date: doc for date, doc in zip(dates, docs) if doc is not None}
+
+
+async def get_mood_rollups_range(user_id: str, start: str = None) -> list:
+    # Daily rollups from `start` (YYYY-MM-DD) onwards, oldest first; one small
+    # doc per logged day instead of every raw entry.
+    from google.cloud.firestore_v1 import FieldFilter
+
+    db = get_db()
+    query = db.collection("users").document(user_id).collection("mood_daily")
+    if start:
+        query = query.where(filter=FieldFilter("date", ">=", start))
+    query = query.order_by("date", direction=ASCENDING)
+    return await _query_dicts(("mood_daily", user_id, start), query)
+
+
+# --- Account Export / Import / Purge ---
+# Paths are relative to users/{user_id}, e.g. ("conversations", session_id, "messages").
+# Everything is read and written in pages, so a user with tens of thousands of
+# messages never has to fit in memory or in one request.
+
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+# A WriteBatch holds at most 500 writes
+PURGE_BATCH_SIZE = min(int(os.getenv("PURGE_BATCH_SIZE", "400")), 500)
+PURGE_CONCURRENCY = int(os.getenv("PURGE_CONCURRENCY", "8"))
+
+
+def _user_collection(db, user_id: str, path: tuple):
+    ref = db.collection("users").document(user_id)
+    for i, name in enumerate(path):
+        ref = ref.collection(name) if i % 2 == 0 else ref.document(name)
+    return ref
+
+
+def _fetch_snapshots(query):
+    return list(query.stream())
+
+
+async def iter_user_documents(user_id: str, path: tuple, order_field: str):
+    # Yields (doc_id, data) one page at a time, ordered by order_field
+    db = get_db()
+    collection = _user_collection(db, user_id, path)
+    cursor = None
+    while True:
+        query = collection.order_by(order_field).limit(EXPORT_PAGE_SIZE)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        snapshots = await run_db(_fetch_snapshots, query)
+        for snap in snapshots:
+            yield snap.id, snap.to_dict()
+        if len(snapshots) < EXPORT_PAGE_SIZE:
+            return
+        cursor = snapshots[-1]
+
+
+def _list_document_refs(collection, limit: int):
+    # Includes "missing" documents that only hold subcollections
+    return list(islice(collection.list_documents(page_size=limit), limit))
+
+
+async def list_user_document_ids(user_id: str, path: tuple, limit: int) -> list:
+    db = get_db()
+    refs = await run_db(_list_document_refs, _user_collection(db, user_id, path), limit)
+    return [ref.id for ref in refs]
+
+
+def _delete_batch(db, refs):
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+
+
+async def delete_user_documents(user_id: str, path: tuple, doc_ids: list):
+    db = get_db()
+    collection = _user_collection(db, user_id, path)
+    refs = [collection.document(doc_id) for doc_id in doc_ids]
+    for i in range(0, len(refs), PURGE_BATCH_SIZE):
+        await run_db(_delete_batch, db, refs[i : i + PURGE_BATCH_SIZE])
+
+
+async def purge_user_collection(user_id: str, path: tuple, limiter, on_progress=None) -> int:
+    # Deletes every document of one collection (not their subcollections).
+    # Each round lists what is left and deletes it in batches of
+    # PURGE_BATCH_SIZE, with `limiter` (a semaphore shared by the whole job)
+    # bounding the batches in flight. Already-deleted documents simply aren't listed again, so an
+    # interrupted purge resumes by running it again.
+    db = get_db()
+    collection = _user_collection(db, user_id, path)
+    deleted = 0
+
+    async def delete(refs):
+        async with limiter:
+            await run_db(_delete_batch, db, refs)
+        if on_progress:
+            on_progress(path, len(refs))
+
+    while True:
+        refs = await run_db(
+            _list_document_refs, collection, PURGE_BATCH_SIZE * PURGE_CONCURRENCY
+        )
+        if not refs:
+            return deleted
+        await asyncio.gather(
+            *(
+                delete(refs[i : i + PURGE_BATCH_SIZE])
+                for i in range(0, len(refs), PURGE_BATCH_SIZE)
+            )
+        )
+        deleted += len(refs)
+
+
+def _write_batch(db, user_id, writes):
+    batch = db.batch()
+    for path, doc_id, data in writes:
+        if path:
+            ref = _user_collection(db, user_id, path).document(doc_id)
+        else:
+            ref = db.collection("users").document(user_id)
+        batch.set(ref, data, merge=True)
+    batch.commit()
+
+
+async def write_user_documents(user_id: str, writes: list):
+    # writes: [(path, doc_id, data)]; an empty path is the profile document
+    db = get_db()
+    await _ensure_writable(user_id)
+    for i in range(0, len(writes), PURGE_BATCH_SIZE):
+        await run_db(_write_batch, db, user_id, writes[i : i + PURGE_BATCH_SIZE])
+    invalidate_user_cache(user_id)
+
+
+# Purge progress lives outside users/{id}, which the purge deletes
+async def get_purge_job(user_id: str):
+    db = get_db()
+    [job] = await _get_documents([db.collection("purge_jobs").document(user_id)])
+    return job
+
+
+async def save_purge_job(user_id: str, data: dict):
+    db = get_db()
+    await run_db(db.collection("purge_jobs").document(user_id).set, data, merge=True)
+
+
+async def get_running_purge_jobs() -> list:
+    from google.cloud.firestore_v1 import FieldFilter
+
+    db = get_db()
+    query = db.collection("purge_jobs").where(filter=FieldFilter("status", "==", "running"))
+    return await run_db(_fetch_dicts, query)
+
+
+# A purge job doubles as the tombstone of a deleted account: once it exists,
+# nothing may be written under users/{id} again. security.py refuses the
+# user's tokens, and the user-scoped writes above check it too, which catches
+# background writers (turn saves, summaries, topic flushes) still in flight.
+# Every worker learns about deletions from a DeletionWatcher, which asks
+# purge_jobs for tombstones started since its last poll (one small query
+# every DELETED_USER_POLL_SECONDS per worker, however many users are active),
+# so neither requests nor writes read purge_jobs/{id} themselves. Only when
+# the watcher isn't running (scripts) or has stopped hearing back do writes
+# fall back to reading the job, trusting a "not deleted" answer for
+# DELETED_USER_CHECK_TTL seconds.
+DELETED_USER_POLL_SECONDS = float(os.getenv("DELETED_USER_POLL_SECONDS", "2"))
+DELETED_USER_CHECK_TTL = float(os.getenv("DELETED_USER_CHECK_TTL", "30"))
+# Tokens outlive neither this nor JWT_EXPIRE_MINUTES, so older tombstones
+# don't need loading at startup
+DELETED_USER_LOOKBACK = timedelta(minutes=int(os.getenv("JWT_EXPIRE_MINUTES", str(60 * 24))))
+# Another worker's clock may lag ours; every poll re-reads this much
+DELETED_USER_POLL_OVERLAP = timedelta(seconds=60)
+
+_deleted_users = set()
+_live_users = TTLCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")), ttl=DELETED_USER_CHECK_TTL
+)
+
+
+class UserDeleted(Exception):
+    pass
+
+
+class DeletionWatcher:
+    def __init__(self):
+        self._task = None
+        self._latest = None
+        self._heard_at = None
+        self.polls = 0
+        self.errors = 0
+
+    @property
+    def current(self) -> bool:
+        # True while polls are succeeding, i.e. _deleted_users is up to date
+        return (
+            self._heard_at is not None
+            and time.monotonic() - self._heard_at < 3 * DELETED_USER_POLL_SECONDS
+        )
+
+    async def poll(self):
+        from google.cloud.firestore_v1 import FieldFilter
+
+        db = get_db()
+        since = self._latest or (datetime.utcnow() - DELETED_USER_LOOKBACK).isoformat()
+        start = (datetime.fromisoformat(since) - DELETED_USER_POLL_OVERLAP).isoformat()
+        query = db.collection("purge_jobs").where(filter=FieldFilter("started_at", ">=", start))
+        jobs = await run_db(_fetch_dicts, query)
+        for job in jobs:
+            mark_user_deleted(job["user_id"])
+        self._latest = max([since] + [job["started_at"] for job in jobs])
+        self._heard_at = time.monotonic()
+        self.polls += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Could not poll account deletions: {e}")
+            await asyncio.sleep(DELETED_USER_POLL_SECONDS)
+
+    async def start(self):
+        # First poll before serving, so a restarted worker already knows
+        # about recent deletions
+        try:
+            await self.poll()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Could not load account deletions: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "deleted_users": len(_deleted_users),
+            "current": self.current,
+            "polls": self.polls,
+            "errors": self.errors,
+        }
+
+
+deletion_watcher = DeletionWatcher()
+
+
+def user_deleted_locally(user_id: str) -> bool:
+    # No I/O: for the request path
+    return user_id in _deleted_users
+
+
+async def is_user_deleted(user_id: str) -> bool:
+    if user_id in _deleted_users:
+        return True
+    if deletion_watcher.current or _live_users.get(user_id) is not MISSING:
+        return False
+    if await get_purge_job(user_id) is not None:
+        mark_user_deleted(user_id)
+        return True
+    _live_users.set(user_id, True)
+    return False
+
+
+def mark_user_deleted(user_id: str):
+    _deleted_users.add(user_id)
+    _live_users.delete(user_id)
+
+
+async def _ensure_writable(user_id: str):
+    if await is_user_deleted(user_id):
+        raise UserDeleted(f"Account {user_id} has been deleted")
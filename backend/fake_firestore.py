@@ -0,0 +1,289 @@
+import copy
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# In-memory stand-in for the subset of the Firestore client API used by database.py.
+# Enabled with FIRESTORE_BACKEND=memory; FAKE_FIRESTORE_LATENCY_MS adds a blocking
+# delay to every round trip so concurrency behaves like a real network client.
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+
+def _latency():
+    delay = float(os.getenv("FAKE_FIRESTORE_LATENCY_MS", "0"))
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    @property
+    def path(self):
+        return "/".join(self._path)
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._path[:-1])
+
+    def collection(self, name):
+        return CollectionReference(self._client, self._path + (name,))
+
+    def get(self):
+        _latency()
+        return self._client._get(self._path)
+
+    def set(self, data, merge=False):
+        _latency()
+        self._client._set(self._path, data, merge)
+
+    def update(self, data):
+        _latency()
+        self._client._update(self._path, data)
+
+    def delete(self):
+        _latency()
+        self._client._delete(self._path)
+
+
+class Query:
+    def __init__(self, client, path, filters=None, orders=None, limit=None, cursor=None):
+        self._client = client
+        self._path = path
+        self._filters = filters or []
+        self._orders = orders or []
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            "filters": list(self._filters),
+            "orders": list(self._orders),
+            "limit": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return Query(self._client, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        if isinstance(document_fields_or_snapshot, DocumentSnapshot):
+            # Like Firestore, a snapshot cursor also pins the document id
+            snapshot = document_fields_or_snapshot
+            document_fields_or_snapshot = {**snapshot.to_dict(), "__name__": snapshot.id}
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def stream(self):
+        _latency()
+        return iter(self._client._query(self))
+
+    def get(self):
+        return list(self.stream())
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: b in (a or []),
+}
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._path[-1]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.utcnow(), ref
+
+    def list_documents(self, page_size=None):
+        return [DocumentReference(self._client, p) for p in self._client._children(self._path)]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append(("set", reference._path, data, merge))
+
+    def update(self, reference, data):
+        self._ops.append(("update", reference._path, data, False))
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference._path, None, False))
+
+    def commit(self):
+        _latency()
+        with self._client._lock:
+            for op, path, data, merge in self._ops:
+                if op == "set":
+                    self._client._set(path, data, merge)
+                elif op == "update":
+                    self._client._update(path, data)
+                else:
+                    self._client._delete(path)
+        self._ops = []
+
+
+class FakeFirestoreClient:
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return CollectionReference(self, (name,))
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def get_all(self, references):
+        _latency()
+        return [self._get(ref._path) for ref in references]
+
+    # --- storage ---
+
+    def _get(self, path):
+        with self._lock:
+            data = copy.deepcopy(self._docs.get(path))
+        return DocumentSnapshot(DocumentReference(self, path), data)
+
+    def _set(self, path, data, merge):
+        with self._lock:
+            current = self._docs.get(path, {}) if merge else {}
+            self._docs[path] = self._apply(current, data)
+
+    def _update(self, path, data):
+        with self._lock:
+            if path not in self._docs:
+                raise KeyError(f"No document to update: {'/'.join(path)}")
+            self._docs[path] = self._apply(self._docs[path], data)
+
+    def _delete(self, path):
+        with self._lock:
+            self._docs.pop(path, None)
+
+    def _apply(self, current, data):
+        result = copy.deepcopy(current)
+        for key, value in data.items():
+            result[key] = _transform(result.get(key), value)
+        return result
+
+    def _children(self, collection_path):
+        # Like list_documents(), includes documents that only have subcollections
+        depth = len(collection_path) + 1
+        with self._lock:
+            return list(dict.fromkeys(
+                p[:depth] for p in self._docs
+                if len(p) >= depth and p[: depth - 1] == collection_path
+            ))
+
+    def _query(self, query):
+        with self._lock:
+            docs = [
+                (p, copy.deepcopy(d))
+                for p, d in self._docs.items()
+                if len(p) == len(query._path) + 1 and p[:-1] == query._path
+            ]
+
+        for field, op, value in query._filters:
+            docs = [(p, d) for p, d in docs if _OPS[op](d.get(field), value)]
+
+        orders = list(query._orders)
+        if orders and "__name__" not in dict(orders):
+            # Firestore breaks ties by document id, in the last order's direction
+            orders.append(("__name__", orders[-1][1]))
+        for field, direction in reversed(orders):
+            docs.sort(
+                key=lambda item: (_field(item, field) is None, _field(item, field)),
+                reverse=direction == DESCENDING,
+            )
+
+        if query._cursor is not None and query._orders:
+            docs = [(p, d) for p, d in docs if _after((p, d), query._cursor, orders)]
+
+        if query._limit is not None:
+            docs = docs[: query._limit]
+
+        return [DocumentSnapshot(DocumentReference(self, p), d) for p, d in docs]
+
+
+def _transform(current, value):
+    # Mirrors the server-side Increment / Maximum / Minimum field transforms
+    kind = type(value).__name__
+    if kind == "Increment":
+        return (current or 0) + value.value
+    if kind == "Maximum":
+        return value.value if current is None else max(current, value.value)
+    if kind == "Minimum":
+        return value.value if current is None else min(current, value.value)
+    return copy.deepcopy(value)
+
+
+def _field(item, field):
+    # "__name__" orders by document id, as in Firestore
+    path, doc = item
+    return path[-1] if field == "__name__" else doc.get(field)
+
+
+def _after(item, cursor, orders):
+    for field, direction in orders:
+        if field not in cursor:
+            # A cursor shorter than the ordering only constrains its own fields
+            break
+        a, b = _field(item, field), cursor.get(field)
+        if a == b:
+            continue
+        return a > b if direction != DESCENDING else a < b
+    return False
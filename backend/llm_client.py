@@ -0,0 +1,135 @@
+import asyncio
+import os
+import httpx
+
+# Shared async HTTP layer for the LLM providers.
+# One pooled httpx.AsyncClient per process (keep-alive connections are reused
+# across chats) plus a semaphore per provider so a slow upstream can't take
+# every connection in the pool.
+# Base URLs are overridable so the whole layer can run against a local stub server.
+
+PROVIDERS = {
+    "groq": {
+        "base_url": os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1"),
+        "max_concurrency": int(os.getenv("GROQ_MAX_CONCURRENCY", "32")),
+        "timeout": float(os.getenv("GROQ_TIMEOUT", "30")),
+    },
+    "gemini": {
+        "base_url": os.getenv(
+            "GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"
+        ),
+        "max_concurrency": int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+        "timeout": float(os.getenv("GEMINI_TIMEOUT", "30")),
+    },
+    "chatgpt": {
+        "base_url": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        "max_concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+        "timeout": float(os.getenv("OPENAI_TIMEOUT", "30")),
+    },
+}
+
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+
+class ProviderError(Exception):
+    def __init__(self, provider: str, message: str, status_code: int = None):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+
+
+class ProviderNotConfigured(ProviderError):
+    # e.g. the API key is missing; nothing was sent upstream
+    pass
+
+
+class LLMClient:
+    def __init__(self, providers: dict = None):
+        self.providers = providers or PROVIDERS
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        self._semaphores = {
+            name: asyncio.Semaphore(cfg["max_concurrency"])
+            for name, cfg in self.providers.items()
+        }
+
+    async def post_json(
+        self, provider: str, path: str, payload: dict, headers: dict = None
+    ) -> dict:
+        cfg = self.providers[provider]
+        async with self._semaphores[provider]:
+            try:
+                response = await self._http.post(
+                    cfg["base_url"] + path,
+                    json=payload,
+                    headers=headers,
+                    timeout=cfg["timeout"],
+                )
+            except httpx.TimeoutException:
+                raise ProviderError(provider, f"timed out after {cfg['timeout']}s")
+            except httpx.HTTPError as e:
+                raise ProviderError(provider, str(e))
+
+        if response.status_code != 200:
+            raise ProviderError(provider, response.text, response.status_code)
+        try:
+            return response.json()
+        except ValueError:
+            raise ProviderError(provider, f"Invalid JSON response: {response.text[:200]}")
+
+    async def stream_lines(
+        self, provider: str, path: str, payload: dict, headers: dict = None
+    ):
+        # Yields raw response lines as they arrive (SSE framing is left to the caller)
+        cfg = self.providers[provider]
+        async with self._semaphores[provider]:
+            try:
+                async with self._http.stream(
+                    "POST",
+                    cfg["base_url"] + path,
+                    json=payload,
+                    headers=headers,
+                    timeout=cfg["timeout"],
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise ProviderError(
+                            provider, body.decode("utf-8", "replace"), response.status_code
+                        )
+                    async for line in response.aiter_lines():
+                        if line:
+                            yield line
+            except httpx.TimeoutException:
+                raise ProviderError(provider, f"timed out after {cfg['timeout']}s")
+            except httpx.HTTPError as e:
+                raise ProviderError(provider, str(e))
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+_client = None
+
+
+def get_llm_client() -> LLMClient:
+    # Created lazily so scripts that never start the app still work
+    global _client
+    if _client is None:
+        _client = LLMClient()
+    return _client
+
+
+async def init_llm_client():
+    get_llm_client()
+
+
+async def close_llm_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,19 +1,70 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import os
 from dotenv import load_dotenv
 
+# .env is loaded once, before any module reads its settings at import time
+if os.getenv("ENVIRONMENT") != "production":
+    load_dotenv()
+
+from fastapi import FastAPI, Request, Depends, Response
+from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import uvicorn
+
 # Import routers
 from auth import router as auth_router
-from chat import router as chat_router
+from chat import router as chat_router, provider_router, complete_groq
 from mood import router as mood_router
 from user import router as user_router
+from llm_client import init_llm_client, close_llm_client
+from database import (
+    get_db,
+    begin_request_scope,
+    end_request_scope,
+    get_profile_cache_stats,
+    get_read_stats,
+    deletion_watcher,
+)
+from response_cache import response_cache
+from security import current_user_id, token_user_id, authorize_internal, get_auth_cache_stats
+from utils import get_password_pool_stats, shutdown_password_pool
+from auth_provider import get_auth_provider
+from rate_limit import rate_limiter
+from topics import topic_pipeline
+from sessions import session_manager
+from summarizer import session_summarizer
+from account_data import purge_manager
+from prompts import get_prompt_stats
+from metrics import HTTP_REQUEST_SECONDS, render_metrics
+import time
 
-if os.getenv("ENVIRONMENT") != "production":
-    load_dotenv()
 
-app = FastAPI(title="MindMate API", description="AI Mental Wellness Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created here, once per worker, rather than at import time.
+    # Everything is also created lazily on first use, so scripts and tests can
+    # import any module without credentials.
+    get_db()
+    # Deletions started on any worker, so their tokens are refused here too
+    await deletion_watcher.start()
+    # Shared, pooled LLM HTTP client for the lifetime of the worker
+    await init_llm_client()
+    topic_pipeline.start()
+    # Summaries use the cheap Groq model; failures leave the history untrimmed
+    session_summarizer.start(complete_groq)
+    # Account purges interrupted by a restart carry on where they stopped
+    await purge_manager.resume()
+    yield
+    await topic_pipeline.stop()
+    await session_summarizer.stop()
+    await purge_manager.stop()
+    await deletion_watcher.stop()
+    await close_llm_client()
+    shutdown_password_pool()
+
+
+app = FastAPI(
+    title="MindMate API", description="AI Mental Wellness Backend", lifespan=lifespan
+)
 
 # CORS
 # CORS
@@ -27,11 +78,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    # Labelled by route template (/mood/week/{user_id}), not the raw path
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, route_template(request), str(status)
+        ).observe(time.perf_counter() - start)
+
+
+# Full path template of every route of the included routers (prefix + route
+# path). The matched route in the request scope is the router's own route,
+# whose path doesn't carry the prefix.
+_route_templates = {}
+
+
+def include_router(router, prefix: str, **kwargs):
+    app.include_router(router, prefix=prefix, **kwargs)
+    for route in router.routes:
+        _route_templates[id(route)] = prefix + route.path
+
+
+def route_template(request: Request) -> str:
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    return _route_templates.get(id(route), getattr(route, "path", "unmatched"))
+
+
+@app.middleware("http")
+async def request_scope(request: Request, call_next):
+    # Per-request profile cache: repeated get_user() calls in one request hit memory
+    token = begin_request_scope()
+    try:
+        return await call_next(request)
+    finally:
+        end_request_scope(token)
+
+
 # Include Routers
-app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
-app.include_router(chat_router, prefix="/chat", tags=["Chat"])
-app.include_router(mood_router, prefix="/mood", tags=["Mood"])
-app.include_router(user_router, prefix="/user", tags=["User"])
+include_router(auth_router, prefix="/auth", tags=["Authentication"])
+# Everything except /auth needs a valid Bearer token (see security.py).
+# /user checks per route: the deletion routes accept accounts being deleted.
+protected = [Depends(current_user_id)]
+include_router(chat_router, prefix="/chat", tags=["Chat"], dependencies=protected)
+include_router(mood_router, prefix="/mood", tags=["Mood"], dependencies=protected)
+include_router(
+    user_router, prefix="/user", tags=["User"], dependencies=[Depends(token_user_id)]
+)
 
 
 @app.get("/")
@@ -39,6 +140,32 @@ def read_root():
     return {"message": "MindMate API is running! 🧠"}
 
 
+@app.get("/stats", dependencies=[Depends(authorize_internal)])
+def read_stats():
+    return {
+        "profile_cache": get_profile_cache_stats(),
+        "firestore_reads": get_read_stats(),
+        "auth_cache": get_auth_cache_stats(),
+        "auth_provider": get_auth_provider().stats(),
+        "password_hashing": get_password_pool_stats(),
+        "response_cache": response_cache.stats(),
+        "llm_providers": provider_router.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "topics": topic_pipeline.stats(),
+        "sessions": session_manager.stats(),
+        "summaries": session_summarizer.stats(),
+        "account_purges": purge_manager.stats(),
+        "account_deletions": deletion_watcher.stats(),
+        "prompts": get_prompt_stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(authorize_internal)])
+def read_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
@@ -0,0 +1,66 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Prometheus metrics, served at GET /metrics.
+# Histograms give p50/p95/p99 per label through histogram_quantile(), e.g.
+#   histogram_quantile(0.95, sum by (le, stage) (rate(mindmate_chat_stage_seconds_bucket[5m])))
+# so a slow chat can be traced to the LLM, Firestore or our own code.
+
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+_HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "mindmate_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=_HTTP_BUCKETS,
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "mindmate_chat_stage_seconds",
+    "Time spent in each stage of the chat pipeline",
+    ["stage"],
+    buckets=_FAST_BUCKETS + (20, 30),
+)
+LLM_CALL_SECONDS = Histogram(
+    "mindmate_llm_call_seconds",
+    "LLM provider call latency (time to first token for streams)",
+    ["provider", "kind", "outcome"],
+    buckets=_LLM_BUCKETS,
+)
+FIRESTORE_OP_SECONDS = Histogram(
+    "mindmate_firestore_op_seconds",
+    "Firestore round-trip latency by operation",
+    ["op"],
+    buckets=_FAST_BUCKETS,
+)
+FIRESTORE_OPS = Counter(
+    "mindmate_firestore_ops_total",
+    "Firestore round trips by operation and outcome",
+    ["op", "outcome"],
+)
+
+
+@contextmanager
+def stage(name: str):
+    # with stage("profile_load"): ... records into mindmate_chat_stage_seconds
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        CHAT_STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+def observe_llm_call(provider: str, seconds: float, ok: bool, kind: str = "completion"):
+    LLM_CALL_SECONDS.labels(provider, kind, "ok" if ok else "error").observe(seconds)
+
+
+def observe_firestore_op(op: str, seconds: float, ok: bool):
+    FIRESTORE_OPS.labels(op, "ok" if ok else "error").inc()
+    FIRESTORE_OP_SECONDS.labels(op).observe(seconds)
+
+
+def render_metrics():
+    # (body, content type) for the /metrics endpoint
+    return generate_latest(), CONTENT_TYPE_LATEST
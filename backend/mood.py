@@ -1,8 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel
-from database import save_mood, get_moods_week
-from datetime import datetime
-from collections import defaultdict
+from database import (
+    save_mood,
+    get_moods_week,
+    get_moods_range,
+    get_mood_rollups,
+    get_mood_rollups_range,
+)
+from security import current_user_id, ensure_owner, authorize_user
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
@@ -18,55 +24,52 @@ class MoodLogRequest(BaseModel):
 
 
 @router.post("/log")
-async def log_mood(request: MoodLogRequest):
+async def log_mood(request: MoodLogRequest, token_user_id=Depends(current_user_id)):
+    ensure_owner(token_user_id, request.user_id)
     data = request.dict()
     await save_mood(request.user_id, data)
     return {"success": True, "message": "Mood logged successfully!"}
 
 
-@router.get("/today/{user_id}")
+@router.get("/today/{user_id}", dependencies=[Depends(authorize_user)])
 async def get_today_moods(user_id: str):
-    # For MVP, we fetch week and filter for today in python or just return all
-    # Ideally, DB query should filter.
-    all_moods = await get_moods_week(user_id)
-    today_str = datetime.now().strftime("%Y-%m-%d")
-
-    today_moods = [m for m in all_moods if m.get("timestamp", "").startswith(today_str)]
+    # Stored timestamps are UTC, so "today" is the UTC day
+    today_str = datetime.utcnow().strftime("%Y-%m-%d")
+    today_moods = await get_moods_range(user_id, today_str)
     return {"moods": today_moods}
 
 
-@router.get("/week/{user_id}")
-async def get_week_moods(user_id: str):
-    moods = await get_moods_week(user_id)
-
-    # Process data for chart
-    # Group by date
-    grouped = defaultdict(list)
-    for m in moods:
-        # timestamp format: 2025-12-07T20:30:00Z
-        date_str = m.get("timestamp", "").split("T")[0]
-        grouped[date_str].append(m.get("mood_score", 0))
+@router.get("/week/{user_id}", dependencies=[Depends(authorize_user)])
+async def get_week_moods(user_id: str, include_moods: bool = False):
+    # Chart and statistics come from the per-day rollup docs (at most 7 small
+    # reads in one get_all). Raw entries are only read when a client opts in
+    # with include_moods=true.
+    today = datetime.utcnow().date()
+    dates = [(today - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
+    rollups = await get_mood_rollups(user_id, dates)
+    moods = await get_moods_week(user_id) if include_moods else []
 
     week_data = []
     total_score = 0
     total_entries = 0
 
-    # Sort by date
-    sorted_dates = sorted(grouped.keys())
-
-    for date in sorted_dates:
-        scores = grouped[date]
-        avg = sum(scores) / len(scores)
+    for date in dates:
+        rollup = rollups.get(date)
+        if not rollup or not rollup.get("count"):
+            continue
+        avg = rollup["sum"] / rollup["count"]
         week_data.append(
             {
                 "date": date,
                 "average_score": round(avg, 1),
-                "entries": len(scores),
+                "entries": rollup["count"],
+                "min_score": rollup.get("min"),
+                "max_score": rollup.get("max"),
                 "moods": [],  # simplified
             }
         )
-        total_score += sum(scores)
-        total_entries += len(scores)
+        total_score += rollup["sum"]
+        total_entries += rollup["count"]
 
     stats = {
         "weekly_average": (
@@ -90,3 +93,21 @@ async def get_week_moods(user_id: str):
         "week_data": week_data,
         "statistics": stats,
     }
+
+
+@router.get("/trends/{user_id}", dependencies=[Depends(authorize_user)])
+async def get_mood_trends(user_id: str, range: str = Query("month")):
+    # pandas is imported on the first trends request, not at startup
+    from analytics import RANGES, daily_from_rollups, compute_trends
+
+    if range not in RANGES:
+        raise HTTPException(
+            status_code=400, detail=f"range must be one of: {', '.join(RANGES)}"
+        )
+    days = RANGES[range]
+    today = datetime.utcnow().date()
+    start = (today - timedelta(days=days - 1)).isoformat() if days else None
+
+    rollups = await get_mood_rollups_range(user_id, start)
+    trends = compute_trends(daily_from_rollups(rollups), today=today)
+    return {"range": range, **trends}
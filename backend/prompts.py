@@ -1,3 +1,8 @@
+import hashlib
+import os
+from cache import TTLCache
+from context import estimate_tokens
+
 MINDMATE_PERSONALITY = """
 You are MindMate, a compassionate AI mental wellness companion.
 
@@ -35,16 +40,158 @@ If message contains: "suicide", "kill myself", "hurt myself", "end it all", "wan
 """
 
 
-def get_system_prompt(user_name: str, context: str = "") -> str:
-    return f"""{MINDMATE_PERSONALITY}
+# --- Template registry ---
+# Each template is split once, at import, into a static prefix (everything
+# before the first {name}/{topics} field) and a suffix rendered per user.
+# The prefix is byte-identical for every user of a version, so providers that
+# cache prompt prefixes can reuse it; prefix_hash identifies it.
+# v1 is the original layout. v2 moves the tone examples above the user
+# context so the whole instruction block is shared.
+# PROMPT_TEMPLATE_VERSION picks the default; PROMPT_AB_SPLIT (e.g. "v1:50,v2:50")
+# assigns users to versions by a stable hash of their id, and a `prompt_version`
+# field on the user document pins one user to a version.
+
+TEMPLATE_V1 = MINDMATE_PERSONALITY + """
 
 USER CONTEXT:
-Name: {user_name}
-Recent Topics: {context}
+Name: {name}
+Recent Topics: {topics}{summary}
+
+TONE EXAMPLES:
+✗ WRONG: "I understand you're experiencing stress. Tell me more."
+✓ RIGHT: "Yeah, that sounds rough, {name}. What's the hardest part right now?"
+
+Now respond to the user's message with genuine care.
+"""
+
+TEMPLATE_V2 = MINDMATE_PERSONALITY + """
 
 TONE EXAMPLES:
 ✗ WRONG: "I understand you're experiencing stress. Tell me more."
-✓ RIGHT: "Yeah, that sounds rough, {user_name}. What's the hardest part right now?"
+✓ RIGHT: "Yeah, that sounds rough, [their name]. What's the hardest part right now?"
+
+USER CONTEXT:
+Name: {name}
+Recent Topics: {topics}{summary}
 
 Now respond to the user's message with genuine care.
 """
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class RenderedPrompt:
+    def __init__(self, template, text: str, tokens: int, has_summary: bool = False):
+        self.text = text
+        self.tokens = tokens
+        self.version = template.version
+        self.template_hash = template.template_hash
+        self.prefix_hash = template.prefix_hash
+        self.has_summary = has_summary
+
+
+class PromptTemplate:
+    def __init__(self, version: str, text: str):
+        self.version = version
+        cut = min(i for i in (text.find("{name}"), text.find("{topics}")) if i >= 0)
+        self.prefix = text[:cut]
+        self.suffix = text[cut:]
+        # Changes whenever the template text changes; invalidates cached replies
+        self.template_hash = _hash(text)
+        self.prefix_hash = _hash(self.prefix)
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.tokens = estimate_tokens(text.format(name="", topics="", summary=""))
+
+    def render(self, user_name: str, context: str = "", summary: str = "") -> RenderedPrompt:
+        suffix = self.suffix.format(
+            name=user_name,
+            topics=context,
+            summary=f"\nEarlier conversation (summary): {summary}" if summary else "",
+        )
+        return RenderedPrompt(
+            self, self.prefix + suffix, self.prefix_tokens + estimate_tokens(suffix), bool(summary)
+        )
+
+    def describe(self) -> dict:
+        return {
+            "template_hash": self.template_hash,
+            "prefix_hash": self.prefix_hash,
+            "prefix_tokens": self.prefix_tokens,
+            "tokens": self.tokens,
+        }
+
+
+PROMPT_TEMPLATES = {t.version: t for t in (PromptTemplate("v1", TEMPLATE_V1), PromptTemplate("v2", TEMPLATE_V2))}
+
+DEFAULT_PROMPT_VERSION = os.getenv("PROMPT_TEMPLATE_VERSION", "v1")
+if DEFAULT_PROMPT_VERSION not in PROMPT_TEMPLATES:
+    raise RuntimeError(f"PROMPT_TEMPLATE_VERSION {DEFAULT_PROMPT_VERSION!r} is not a known template")
+
+
+def _load_ab_split() -> list:
+    split = []
+    for part in filter(None, os.getenv("PROMPT_AB_SPLIT", "").split(",")):
+        version, _, weight = part.strip().partition(":")
+        if version not in PROMPT_TEMPLATES:
+            raise RuntimeError(f"PROMPT_AB_SPLIT names unknown template {version!r}")
+        split.append((version, int(weight or 1)))
+    return split
+
+
+PROMPT_AB_SPLIT = _load_ab_split()
+
+# Identifies the default template; kept for callers that don't pick a version
+PROMPT_TEMPLATE_HASH = PROMPT_TEMPLATES[DEFAULT_PROMPT_VERSION].template_hash
+
+# (user_id, version, name, topics, summary) -> RenderedPrompt. The key holds
+# everything the prompt depends on, so a profile change (new name, new topics,
+# new version) or a new session summary renders afresh and the old entry ages
+# out of the LRU.
+_rendered = TTLCache(
+    maxsize=int(os.getenv("PROMPT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROMPT_CACHE_TTL", "3600")),
+)
+
+
+def select_version(user_id: str, user: dict = None) -> str:
+    pinned = (user or {}).get("prompt_version")
+    if pinned in PROMPT_TEMPLATES:
+        return pinned
+    if not PROMPT_AB_SPLIT:
+        return DEFAULT_PROMPT_VERSION
+    # Stable across workers and restarts (unlike hash())
+    bucket = int(_hash(user_id), 16) % sum(w for _, w in PROMPT_AB_SPLIT)
+    for version, weight in PROMPT_AB_SPLIT:
+        if bucket < weight:
+            return version
+        bucket -= weight
+    return DEFAULT_PROMPT_VERSION
+
+
+def get_system_prompt(
+    user_name: str, context: str = "", version: str = None, summary: str = ""
+) -> str:
+    return PROMPT_TEMPLATES[version or DEFAULT_PROMPT_VERSION].render(user_name, context, summary).text
+
+
+def render_for_user(
+    user_id: str, user_name: str, context: str, user: dict = None, summary: str = ""
+) -> RenderedPrompt:
+    version = select_version(user_id, user)
+    key = (user_id, version, user_name, context, summary)
+    rendered = _rendered.get(key, None)
+    if rendered is None:
+        rendered = PROMPT_TEMPLATES[version].render(user_name, context, summary)
+        _rendered.set(key, rendered)
+    return rendered
+
+
+def get_prompt_stats() -> dict:
+    return {
+        "default_version": DEFAULT_PROMPT_VERSION,
+        "ab_split": dict(PROMPT_AB_SPLIT),
+        "templates": {v: t.describe() for v, t in PROMPT_TEMPLATES.items()},
+        "render_cache": _rendered.stats(),
+    }
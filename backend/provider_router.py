@@ -0,0 +1,310 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from llm_client import ProviderError, ProviderNotConfigured
+from metrics import observe_llm_call
+
+# Routes a chat completion across the LLM providers.
+# Each provider has a rolling window of latencies and outcomes and a circuit
+# breaker: when its recent error rate crosses the threshold it is skipped for
+# a cooldown, then a single trial call decides whether it closes again.
+# Requests go to the preferred provider first and fail over down
+# LLM_FAILOVER_ORDER. With hedging on, if the primary hasn't answered by its
+# own p95 latency, a second request is fired at the next healthy provider
+# and whichever succeeds first wins. Providers without an API key are
+# skipped without counting against their breaker.
+
+FAILOVER_ORDER = os.getenv("LLM_FAILOVER_ORDER", "groq,chatgpt,gemini").split(",")
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "50"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderHealth:
+    def __init__(self):
+        self.latencies = deque(maxlen=BREAKER_WINDOW)
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_COOLDOWN:
+                return False
+            self.state = HALF_OPEN
+            self._trial_in_flight = False
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    @property
+    def healthy(self) -> bool:
+        return self.state == CLOSED
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def p95(self):
+        if len(self.latencies) < BREAKER_MIN_CALLS:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def record_success(self, latency: float = None):
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(True)
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.outcomes.clear()
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        # A trial that ended without an answer either way (cancelled, or the
+        # provider isn't configured): let the next call be the trial instead
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self._trial_in_flight = False
+        if self.state == HALF_OPEN or (
+            len(self.outcomes) >= BREAKER_MIN_CALLS
+            and self.error_rate() >= BREAKER_ERROR_RATE
+        ):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "calls_in_window": len(self.outcomes),
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class ProviderRouter:
+    def __init__(self, providers: dict, streamers: dict = None, order: list = None):
+        # providers: name -> async fn(*args) -> str, raising ProviderError
+        # streamers: name -> async generator fn(*args) yielding text fragments
+        self.providers = providers
+        self.streamers = streamers or {}
+        self.order = [p for p in (order or FAILOVER_ORDER) if p in providers]
+        self.health = {name: ProviderHealth() for name in providers}
+        self.hedge_enabled = HEDGE_ENABLED
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _candidates(self, preferred: str) -> list:
+        first = [preferred] if preferred in self.providers else []
+        return first + [p for p in self.order if p != preferred]
+
+    async def _call(self, name: str, args):
+        health = self.health[name]
+        start = time.perf_counter()
+        try:
+            result = await self.providers[name](*args)
+        except (asyncio.CancelledError, ProviderNotConfigured):
+            health.release_trial()
+            raise
+        except ProviderError:
+            health.record_failure()
+            observe_llm_call(name, time.perf_counter() - start, ok=False)
+            raise
+        except Exception as e:
+            health.record_failure()
+            observe_llm_call(name, time.perf_counter() - start, ok=False)
+            raise ProviderError(name, str(e))
+        elapsed = time.perf_counter() - start
+        health.record_success(elapsed)
+        observe_llm_call(name, elapsed, ok=True)
+        return result
+
+    def _hedge_delay(self, name: str):
+        p95 = self.health[name].p95()
+        if p95 is None:
+            return None
+        return max(p95, HEDGE_MIN_DELAY)
+
+    async def _race(self, primary: str, backup: str, args, tried: set):
+        primary_task = asyncio.create_task(self._call(primary, args))
+        delay = self._hedge_delay(primary) if backup else None
+        if delay is None:
+            return await primary_task, primary
+
+        tasks = {primary_task: primary}
+        error = None
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if done:
+                return primary_task.result(), primary
+
+            self.hedges += 1
+            tried.add(backup)
+            tasks[asyncio.create_task(self._call(backup, args))] = backup
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is None:
+                        if name == backup:
+                            self.hedge_wins += 1
+                        return task.result(), name
+                    error = task.exception()
+        finally:
+            # Losers (and both, if we are cancelled) release their breaker trial
+            for task in tasks:
+                task.cancel()
+        raise error
+
+    async def complete(self, preferred: str, *args):
+        # Returns (text, provider_name); raises ProviderError if every provider fails
+        errors = []
+        tried = set()
+        for name in self._candidates(preferred):
+            if name in tried or not self.health[name].allow():
+                continue
+            tried.add(name)
+            backup = None
+            if self.hedge_enabled:
+                backup = next(
+                    (
+                        p
+                        for p in self._candidates(preferred)
+                        if p not in tried and self.health[p].healthy
+                    ),
+                    None,
+                )
+            try:
+                return await self._race(name, backup, args, tried)
+            except ProviderNotConfigured as e:
+                errors.append(e)
+            except ProviderError as e:
+                errors.append(e)
+                self.failovers += 1
+        raise ProviderError(
+            "router",
+            "All providers failed: "
+            + ("; ".join(f"{e.provider}: {e}" for e in errors) or "all circuits open"),
+        )
+
+    async def open_stream(self, preferred: str, *args):
+        # Fails over until a provider produces its first fragment, then commits
+        # to it. Returns (provider_name, async iterator over all fragments).
+        errors = []
+        for name in self._candidates(preferred):
+            if name not in self.streamers or not self.health[name].allow():
+                continue
+            health = self.health[name]
+            stream = self.streamers[name](*args)
+            start = time.perf_counter()
+            try:
+                first = await stream.__anext__()
+            except asyncio.CancelledError:
+                health.release_trial()
+                raise
+            except ProviderNotConfigured as e:
+                health.release_trial()
+                errors.append(e)
+                continue
+            except StopAsyncIteration:
+                health.record_success()
+                observe_llm_call(name, time.perf_counter() - start, ok=True, kind="stream")
+                return name, CommittedStream(None, stream)
+            except Exception as e:
+                health.record_failure()
+                observe_llm_call(name, time.perf_counter() - start, ok=False, kind="stream")
+                if not isinstance(e, ProviderError):
+                    e = ProviderError(name, str(e))
+                errors.append(e)
+                self.failovers += 1
+                continue
+            # Time to first token, kept out of the completion-latency window
+            health.record_success()
+            observe_llm_call(name, time.perf_counter() - start, ok=True, kind="stream")
+            return name, CommittedStream(first, stream)
+        raise ProviderError(
+            "router",
+            "All providers failed: "
+            + ("; ".join(f"{e.provider}: {e}" for e in errors) or "all circuits open"),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "order": self.order,
+            "hedging": self.hedge_enabled,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "providers": {name: h.snapshot() for name, h in self.health.items()},
+        }
+
+
+class CommittedStream:
+    # The fragments of the provider open_stream() committed to. aclose() shuts
+    # the provider's stream (and its HTTP response) even if iteration never began.
+    def __init__(self, first, stream):
+        self._first = first
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return await self._stream.__anext__()
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class FakeProvider:
+    # Local stand-in for load and failure testing:
+    # ProviderRouter({"groq": FakeProvider(delay=0.2, failure_rate=0.3), ...})
+    def __init__(
+        self,
+        name: str = "fake",
+        reply: str = "I'm here for you.",
+        delay: float = 0.0,
+        failure_rate: float = 0.0,
+    ):
+        self.name = name
+        self.reply = reply
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    async def __call__(self, *args):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if random.random() < self.failure_rate:
+            raise ProviderError(self.name, "injected failure", 503)
+        return self.reply
+
+    async def stream(self, *args):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if random.random() < self.failure_rate:
+            raise ProviderError(self.name, "injected failure", 503)
+        for word in self.reply.split(" "):
+            yield word + " "
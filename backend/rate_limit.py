@@ -0,0 +1,238 @@
+import asyncio
+import math
+import os
+import time
+from fastapi import HTTPException
+from cache import TTLCache, MISSING
+
+# Admission control for the LLM endpoints.
+# Two token buckets are checked per chat request: one per user_id and one per
+# provider, so a single client can't burn the shared provider quota. A request
+# that finds its bucket empty waits for the next token if that arrives within
+# RATE_LIMIT_MAX_WAIT seconds, otherwise it gets a 429 with Retry-After.
+# A request refused by its provider bucket gets its user token back, so a
+# provider outage doesn't drain every user's budget.
+# On top of that, LLM_MAX_INFLIGHT caps concurrent provider calls for the
+# whole process. Buckets live in memory by default; with RATE_LIMIT_BACKEND=redis
+# they are shared by every worker through a small Lua script.
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+
+USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "20"))
+USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "5"))
+
+PROVIDER_PER_MINUTE = float(os.getenv("RATE_LIMIT_PROVIDER_PER_MINUTE", "300"))
+PROVIDER_BURST = float(os.getenv("RATE_LIMIT_PROVIDER_BURST", "30"))
+PROVIDER_LIMITS = {
+    name: float(os.getenv(f"RATE_LIMIT_{env}_PER_MINUTE", PROVIDER_PER_MINUTE))
+    for name, env in (("groq", "GROQ"), ("gemini", "GEMINI"), ("chatgpt", "OPENAI"))
+}
+
+MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "64"))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded ({scope})")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+# --- Bucket Stores ---
+# reserve() takes one token, possibly going into debt up to `max_wait` seconds
+# of refill, and returns (granted, wait_seconds). A granted caller sleeps for
+# wait_seconds before proceeding; a refused one is told how long until a token.
+# refund() returns a token taken by a request that was refused further on.
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = 100000):
+        # Idle buckets expire once they would have refilled anyway
+        self._buckets = TTLCache(maxsize=max_keys, ttl=600)
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float):
+        now = time.monotonic()
+        state = self._buckets.get(key)
+        tokens, stamp = (burst, now) if state is MISSING else state
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+        refill_ttl = burst / rate + 1
+        if wait > max_wait:
+            self._buckets.set(key, (tokens, now), ttl=refill_ttl)
+            return False, wait
+        self._buckets.set(key, (tokens - 1, now), ttl=refill_ttl)
+        return True, wait
+
+    async def refund(self, key: str, rate: float, burst: float):
+        state = self._buckets.get(key)
+        if state is MISSING:
+            return
+        now = time.monotonic()
+        tokens, stamp = state
+        tokens = min(burst, tokens + (now - stamp) * rate + 1)
+        self._buckets.set(key, (tokens, now), ttl=burst / rate + 1)
+
+
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - stamp) * rate)
+local wait = 0
+if tokens < 1 then wait = (1 - tokens) / rate end
+local granted = 0
+if wait <= max_wait then
+  tokens = tokens - 1
+  granted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + 1) * 1000))
+return {granted, tostring(wait)}
+"""
+
+_REFUND_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+if not state[1] then return 0 end
+local tokens = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate + 1)
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst / rate + 1) * 1000))
+return 1
+"""
+
+
+class RedisBucketStore:
+    def __init__(self, url: str, prefix: str = "mindmate:rl:"):
+        import redis.asyncio as redis  # optional dependency, only for shared limits
+
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_RESERVE_SCRIPT)
+        self._refund_script = self._redis.register_script(_REFUND_SCRIPT)
+        self._prefix = prefix
+        self._fallback = MemoryBucketStore()
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float):
+        try:
+            granted, wait = await self._script(
+                keys=[self._prefix + key], args=[rate, burst, max_wait]
+            )
+        except Exception as e:
+            # Redis down: keep limiting, just per worker instead of globally
+            print(f"⚠️ Rate limit store unavailable, using local buckets: {e}")
+            return await self._fallback.reserve(key, rate, burst, max_wait)
+        return bool(granted), float(wait)
+
+    async def refund(self, key: str, rate: float, burst: float):
+        try:
+            await self._refund_script(keys=[self._prefix + key], args=[rate, burst])
+        except Exception as e:
+            print(f"⚠️ Rate limit store unavailable, refund skipped: {e}")
+            await self._fallback.refund(key, rate, burst)
+
+
+# --- Limiter ---
+
+
+class RateLimiter:
+    def __init__(self, store=None, max_wait: float = MAX_WAIT, max_inflight: int = MAX_INFLIGHT):
+        self.store = store or MemoryBucketStore()
+        self.max_wait = max_wait
+        self.max_inflight = max_inflight
+        self._inflight = None
+        self.inflight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {}
+
+    def _reject(self, scope: str, retry_after: float):
+        self.rejected[scope] = self.rejected.get(scope, 0) + 1
+        raise RateLimitExceeded(scope, retry_after)
+
+    async def reserve(self, scope: str, key: str, per_minute: float, burst: float) -> float:
+        # Takes a token or raises RateLimitExceeded; returns how long to wait
+        granted, wait = await self.store.reserve(
+            f"{scope}:{key}", per_minute / 60, burst, self.max_wait
+        )
+        if not granted:
+            self._reject(scope, wait)
+        return wait
+
+    async def take(self, scope: str, key: str, per_minute: float, burst: float):
+        wait = await self.reserve(scope, key, per_minute, burst)
+        if wait > 0:
+            self.queued += 1
+            await asyncio.sleep(wait)
+
+    async def admit(self, user_id: str, provider: str):
+        user_wait = await self.reserve("user", user_id, USER_PER_MINUTE, USER_BURST)
+        try:
+            provider_wait = await self.reserve(
+                "provider", provider, PROVIDER_LIMITS.get(provider, PROVIDER_PER_MINUTE), PROVIDER_BURST
+            )
+        except RateLimitExceeded:
+            # Never reaches the provider, so it mustn't cost the user a token
+            await self.store.refund(f"user:{user_id}", USER_PER_MINUTE / 60, USER_BURST)
+            raise
+        wait = max(user_wait, provider_wait)
+        if wait > 0:
+            self.queued += 1
+            await asyncio.sleep(wait)
+        self.admitted += 1
+
+    async def acquire_slot(self):
+        # Process-wide cap on concurrent provider calls; waits up to max_wait
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+        try:
+            await asyncio.wait_for(self._inflight.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject("inflight", 1.0)
+        self.inflight += 1
+
+    def release_slot(self):
+        self.inflight -= 1
+        self._inflight.release()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "backend": type(self.store).__name__,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+        }
+
+
+def _make_store():
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            store = RedisBucketStore(RATE_LIMIT_REDIS_URL)
+            print("🚦 Rate limits shared via Redis")
+            return store
+        except ImportError:
+            print("⚠️ RATE_LIMIT_BACKEND=redis but the redis package is missing; using memory")
+    return MemoryBucketStore()
+
+
+rate_limiter = RateLimiter(_make_store())
+
+
+def too_many_requests(e: RateLimitExceeded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests. Please slow down and try again shortly.",
+        headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from cache import TTLCache, MISSING
+from utils import normalize_phrase
+
+# Response cache for first-turn chat messages.
+# Entries are keyed by (model, prompt template hash, normalized message). A
+# lookup first tries the exact key, then near-duplicates: every message gets
+# a MinHash signature over character trigrams, and an LSH band index finds
+# earlier messages whose estimated Jaccard similarity is above the threshold
+# ("I'm stressed about exams" ~ "i'm so stressed about my exams!").
+# The user's name is stored as a placeholder so one cached reply serves everyone.
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8"))
+
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.int64)
+
+NAME_PLACEHOLDER = "{{name}}"
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    padded = f" {text} "
+    shingles = {padded[i : i + 3] for i in range(max(len(padded) - 2, 1))}
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles),
+        dtype=np.int64,
+        count=len(shingles),
+    )
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 5000, ttl: float = 3600.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._bands = defaultdict(set)
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0
+        self._avg_call_seconds = 0.0
+        self._timed_calls = 0
+
+    @staticmethod
+    def make_key(model: str, template_hash: str, message: str) -> tuple:
+        return (model, template_hash, normalize_phrase(message))
+
+    def _band_keys(self, key: tuple, signature: np.ndarray):
+        model, template_hash, _ = key
+        for band in range(BANDS):
+            rows = signature[band * ROWS : (band + 1) * ROWS].tobytes()
+            yield (model, template_hash, band, hashlib.blake2b(rows, digest_size=8).digest())
+
+    def lookup(self, key: tuple, user_name: str):
+        entry = self._entries.get(key)
+        if entry is not MISSING:
+            self.exact_hits += 1
+            return self._hit(entry, user_name)
+
+        signature = minhash_signature(key[2])
+        for band_key in self._band_keys(key, signature):
+            for candidate in list(self._bands.get(band_key, ())):
+                entry = self._entries.get(candidate)
+                if entry is MISSING:
+                    self._bands[band_key].discard(candidate)
+                    continue
+                if np.mean(entry[1] == signature) >= SIMILARITY_THRESHOLD:
+                    self.near_hits += 1
+                    return self._hit(entry, user_name)
+
+        self.misses += 1
+        return None
+
+    def _hit(self, entry, user_name: str) -> str:
+        self.saved_seconds += self._avg_call_seconds
+        return entry[0].replace(NAME_PLACEHOLDER, user_name)
+
+    def _prune_bands(self):
+        for band_key in list(self._bands):
+            live = {k for k in self._bands[band_key] if k in self._entries}
+            if live:
+                self._bands[band_key] = live
+            else:
+                del self._bands[band_key]
+
+    def store(self, key: tuple, response: str, user_name: str, call_seconds: float = None):
+        if call_seconds is not None:
+            self._timed_calls += 1
+            self._avg_call_seconds += (call_seconds - self._avg_call_seconds) / self._timed_calls
+        # An empty reply (empty stream, provider returned no content) would be
+        # served to every later opener with this key
+        if not response or not response.strip():
+            return
+        template = response
+        if user_name and len(user_name) > 1:
+            template = re.sub(rf"\b{re.escape(user_name)}\b", NAME_PLACEHOLDER, response)
+        signature = minhash_signature(key[2])
+        self._entries.set(key, (template, signature))
+        for band_key in self._band_keys(key, signature):
+            self._bands[band_key].add(key)
+        self.stores += 1
+        # Evicted/expired keys linger in the band index until pruned
+        if self.stores % self._entries.maxsize == 0:
+            self._prune_bands()
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "avg_provider_call_ms": round(self._avg_call_seconds * 1000, 1),
+            "estimated_latency_saved_ms": round(self.saved_seconds * 1000, 1),
+        }
+
+
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
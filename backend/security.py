@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import os
+import time
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from cache import TTLCache, MISSING
+from utils import verify_jwt
+from database import user_deleted_locally, mark_user_deleted
+
+# Bearer-token authentication for the API routers.
+# Decoded claims are cached in a bounded LRU keyed by a hash of the token
+# until the token expires, so a client sending the same token on every call
+# pays for signature verification once. No Firestore or Firebase Auth lookup
+# happens per request: the token's `sub` is the user_id.
+# Routes that take a user_id (path or body) must match the token's subject.
+# That check is only as strong as /auth/login, which issues a token after
+# verifying the account's password hash (auth.py). A legacy account without
+# a stored hash is unprotected while AUTH_ADOPT_LEGACY_PASSWORDS is on.
+# Once an account deletion starts its tokens are refused, except by the
+# deletion routes themselves, so a client can follow or retry the purge.
+# That check is in memory: every worker's database.deletion_watcher polls
+# for new deletions in the background, so requests never read purge_jobs.
+
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() == "true"
+
+# /stats and /metrics expose service internals. They take
+# `Authorization: Bearer $INTERNAL_API_TOKEN` (e.g. a Prometheus scrape
+# config's bearer token); without one configured they are closed, unless
+# AUTH_REQUIRED=false (local load tests).
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+_claims_cache = TTLCache(
+    maxsize=int(os.getenv("JWT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("JWT_CACHE_MAX_TTL", "3600")),
+)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"}
+    )
+
+
+def decode_token(token: str):
+    # Claims for a valid token, None otherwise
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = _claims_cache.get(key)
+    if claims is not MISSING:
+        if claims["exp"] > time.time():
+            return claims
+        _claims_cache.delete(key)
+        return None
+
+    claims = verify_jwt(token)
+    if claims is None:
+        return None
+    remaining = claims["exp"] - time.time()
+    if remaining > 0:
+        _claims_cache.set(key, claims, ttl=min(remaining, _claims_cache.ttl))
+    return claims
+
+
+async def token_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(_bearer),
+):
+    # FastAPI caches dependencies per request, so this runs once per request
+    # however many routes/dependencies ask for it.
+    if not AUTH_REQUIRED:
+        return None
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    claims = decode_token(credentials.credentials)
+    if claims is None:
+        raise _unauthorized("Invalid or expired token")
+    return claims["sub"]
+
+
+async def current_user_id(user_id=Depends(token_user_id)):
+    if user_id is not None and user_deleted_locally(user_id):
+        raise _unauthorized("Account has been deleted")
+    return user_id
+
+
+def ensure_owner(token_user_id, user_id: str):
+    if token_user_id is not None and token_user_id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to access this user")
+
+
+async def authorize_user(user_id: str, token_user_id=Depends(current_user_id)):
+    # For routes with a {user_id} path parameter
+    ensure_owner(token_user_id, user_id)
+    return user_id
+
+
+async def authorize_account_deletion(user_id: str, token_user_id=Depends(token_user_id)):
+    # Like authorize_user, but still accepted once the account is being deleted
+    ensure_owner(token_user_id, user_id)
+    return user_id
+
+
+async def authorize_internal(
+    credentials: HTTPAuthorizationCredentials = Depends(_bearer),
+):
+    if INTERNAL_API_TOKEN:
+        if credentials is None or not hmac.compare_digest(
+            credentials.credentials.encode("utf-8"), INTERNAL_API_TOKEN.encode("utf-8")
+        ):
+            raise _unauthorized("Not authenticated")
+    elif AUTH_REQUIRED:
+        raise HTTPException(status_code=403, detail="Internal endpoint is disabled")
+
+
+def revoke_user(user_id: str):
+    # Called when a purge starts: refuse the user's tokens from now on
+    mark_user_deleted(user_id)
+    _claims_cache.discard_where(lambda claims: claims.get("sub") == user_id)
+
+
+def get_auth_cache_stats() -> dict:
+    return _claims_cache.stats()
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from cache import TTLCache, MISSING
+from database import get_user, get_latest_session, append_conversation_turn
+
+# Conversation sessions.
+# A session stays open while the user keeps talking and closes after
+# SESSION_IDLE_MINUTES without a message, whatever the clock says, so a chat
+# running past midnight stays one conversation. The open session of each user
+# is remembered per worker; on a miss (new worker, idle gap) the newest
+# session metadata doc is read (one small document) and reopened if it is
+# still within the gap, otherwise a new session starts.
+# All stored times are UTC. `local_date` records the day the session started
+# in the user's time zone (profile `time_zone`, IANA name, else DEFAULT_TIME_ZONE).
+
+SESSION_IDLE = timedelta(minutes=float(os.getenv("SESSION_IDLE_MINUTES", "30")))
+DEFAULT_TIME_ZONE = os.getenv("DEFAULT_TIME_ZONE", "UTC")
+
+
+def user_time_zone(user: dict = None) -> str:
+    name = (user or {}).get("time_zone") or DEFAULT_TIME_ZONE
+    return name if is_valid_time_zone(name) else "UTC"
+
+
+def is_valid_time_zone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def new_session_id(at: datetime) -> str:
+    return at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class SessionManager:
+    def __init__(self):
+        # user_id -> {"session_id", "started_at", "last_activity", "message_count", ...}
+        self._open = TTLCache(
+            maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+            ttl=SESSION_IDLE.total_seconds(),
+        )
+        self._resolving = {}
+        self.opened = 0
+        self.reopened = 0
+
+    @staticmethod
+    def _idle(session: dict, now: datetime) -> bool:
+        last = session.get("last_activity")
+        if not last:
+            return True
+        return now - datetime.fromisoformat(last.rstrip("Z")) > SESSION_IDLE
+
+    async def _resolve(self, user_id: str, now: datetime) -> dict:
+        latest = await get_latest_session(user_id)
+        if latest and not self._idle(latest, now):
+            self.reopened += 1
+            latest.setdefault("message_count", 0)
+            return latest
+
+        user = await get_user(user_id)
+        time_zone = user_time_zone(user)
+        self.opened += 1
+        session = {
+            "session_id": new_session_id(now),
+            "started_at": now.isoformat(),
+            "last_activity": now.isoformat(),
+            "message_count": 0,
+            "time_zone": time_zone,
+            "local_date": now.replace(tzinfo=ZoneInfo("UTC"))
+            .astimezone(ZoneInfo(time_zone))
+            .date()
+            .isoformat(),
+        }
+        # Context from the previous conversation, until this one has its own summary
+        carried = latest and (latest.get("summary") or latest.get("carried_summary"))
+        if carried:
+            session["carried_summary"] = carried
+        return session
+
+    async def current(self, user_id: str, now: datetime = None) -> dict:
+        # The session this message belongs to (opening one if needed)
+        now = now or datetime.utcnow()
+        session = self._open.get(user_id)
+        if session is MISSING or self._idle(session, now):
+            # Concurrent first messages from one user must agree on the session
+            task = self._resolving.get(user_id)
+            if task is None:
+                task = asyncio.ensure_future(self._resolve(user_id, now))
+                self._resolving[user_id] = task
+                task.add_done_callback(lambda _: self._resolving.pop(user_id, None))
+            session = await task
+        session["last_activity"] = max(session["last_activity"], now.isoformat())
+        self._open.set(user_id, session)
+        return session
+
+    async def save_turn(self, user_id: str, session: dict, messages: list):
+        # Messages and the session's metadata doc in one batch
+        fields = {
+            k: session[k]
+            for k in ("started_at", "time_zone", "local_date", "carried_summary")
+            if k in session
+        }
+        # Counted up front so the next turn's history trimming sees this turn
+        session["message_count"] = session.get("message_count", 0) + len(messages)
+        await append_conversation_turn(
+            user_id, messages, session_id=session["session_id"], session_fields=fields
+        )
+
+    def forget(self, user_id: str):
+        self._open.delete(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "open_sessions": len(self._open),
+            "opened": self.opened,
+            "reopened": self.reopened,
+            "idle_minutes": SESSION_IDLE.total_seconds() / 60,
+        }
+
+
+session_manager = SessionManager()
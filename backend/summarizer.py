@@ -0,0 +1,132 @@
+import asyncio
+import os
+from database import get_messages_after, update_session
+
+# Rolling session summaries, so long conversations don't grow the prompt.
+# After a turn is saved, chat.py hands the session to submit(). Once more than
+# SUMMARY_KEEP_RECENT messages are unsummarized, a background worker folds the
+# older ones (at least SUMMARY_MIN_BATCH) into the session's stored summary
+# with one cheap Groq call: the previous summary plus the new messages, never
+# the full history. Only the unsummarized tail is sent as history; the summary
+# goes into the system prompt. A new session starts from the previous
+# session's summary (`carried_summary`), so context carries across days.
+
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "8"))
+SUMMARY_MIN_BATCH = int(os.getenv("SUMMARY_MIN_BATCH", "8"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1200"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", "500"))
+
+SUMMARY_INSTRUCTIONS = """You keep a running summary of a conversation between a college student and MindMate, a wellness companion.
+Update the summary with the new messages. Keep what matters for later turns: what is going on in their life, how they feel, people and events they mentioned, anything they planned or asked MindMate to remember.
+Write at most 120 words in plain prose, third person ("They ..."). Output only the summary."""
+
+
+def session_summary(session: dict) -> str:
+    return session.get("summary") or session.get("carried_summary") or ""
+
+
+def unsummarized(session: dict) -> int:
+    return session.get("message_count", 0) - session.get("summarized_count", 0)
+
+
+def _transcript(messages: list) -> str:
+    return "\n".join(
+        f"{'MindMate' if m.get('type') == 'ai' else 'User'}: {m.get('content', '')}"
+        for m in messages
+    )
+
+
+class SessionSummarizer:
+    def __init__(self):
+        self._complete = None
+        self._queue = None
+        self._tasks = []
+        self._pending = set()
+        self.summarized = 0
+        self.messages_folded = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def submit(self, user_id: str, session: dict):
+        # Never blocks the request; one job per session at a time
+        if self._queue is None or unsummarized(session) < SUMMARY_KEEP_RECENT + SUMMARY_MIN_BATCH:
+            return
+        key = (user_id, session["session_id"])
+        if key in self._pending:
+            return
+        try:
+            self._queue.put_nowait((user_id, session))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        self._pending.add(key)
+
+    async def summarize(self, user_id: str, session: dict):
+        count = unsummarized(session) - SUMMARY_KEEP_RECENT
+        if count < SUMMARY_MIN_BATCH:
+            return
+        messages = await get_messages_after(
+            user_id, session["session_id"], session.get("summarized_through"), count
+        )
+        if not messages:
+            return
+        previous = session_summary(session)
+        summary = await self._complete(
+            SUMMARY_INSTRUCTIONS,
+            f"Current summary:\n{previous or '(none yet)'}\n\nNew messages:\n{_transcript(messages)}",
+        )
+        summary = summary.strip()[:SUMMARY_MAX_CHARS]
+        update = {
+            "summary": summary,
+            "summarized_count": session.get("summarized_count", 0) + len(messages),
+            "summarized_through": messages[-1]["timestamp"],
+        }
+        await update_session(user_id, session["session_id"], update)
+        # The open session dict is shared with sessions.py, so the next turn sees it
+        session.update(update)
+        self.summarized += 1
+        self.messages_folded += len(messages)
+
+    async def _worker(self):
+        while True:
+            user_id, session = await self._queue.get()
+            try:
+                await self.summarize(user_id, session)
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Summarizing session {session['session_id']} of {user_id} failed: {e}")
+            finally:
+                self._pending.discard((user_id, session["session_id"]))
+                self._queue.task_done()
+
+    def start(self, complete):
+        # complete: async fn(system_prompt, user_message) -> str that raises on failure
+        if not SUMMARY_ENABLED:
+            return
+        self._complete = complete
+        self._queue = asyncio.Queue(maxsize=SUMMARY_QUEUE_SIZE)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(SUMMARY_WORKERS)]
+
+    async def stop(self):
+        if self._queue is None:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": SUMMARY_ENABLED,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "summarized": self.summarized,
+            "messages_folded": self.messages_folded,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+session_summarizer = SessionSummarizer()
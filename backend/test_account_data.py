@@ -0,0 +1,121 @@
+import asyncio
+import uuid
+import pytest
+import account_data
+import database
+from account_data import PurgeManager
+from fake_firestore import FakeFirestoreClient
+
+# Account purge against the in-memory Firestore fake: resuming after a
+# restart, write blocking and the settle sweep.
+# Run: python -m pytest test_account_data.py
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = FakeFirestoreClient()
+    monkeypatch.setattr(database, "_db", client)
+    monkeypatch.setattr(account_data, "PURGE_SETTLE_SECONDS", 0.05)
+    monkeypatch.setattr(account_data, "PURGE_PROGRESS_INTERVAL", 0.01)
+    return client
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def user_docs(db, user_id):
+    return [path for path in db._docs if path[:2] == ("users", user_id)]
+
+
+async def seed(user_id, sessions=3, messages=10):
+    await database.create_user(user_id, {"name": "Test", "email": f"{user_id}@example.com"})
+    await database.save_password_hash(user_id, "$2b$04$hash")
+    for s in range(sessions):
+        turn = [{"type": "user", "content": f"m{i}"} for i in range(messages)]
+        await database.append_conversation_turn(user_id, turn, session_id=f"2026-03-0{s + 1}")
+    for score in (3, 7):
+        await database.save_mood(user_id, {"mood_emoji": "x", "mood_score": score})
+
+
+async def wait_for(manager, user_id):
+    while user_id in manager._tasks:
+        await asyncio.sleep(0.01)
+    return await database.get_purge_job(user_id)
+
+
+def test_interrupted_purge_resumes_and_removes_everything(db, monkeypatch):
+    user_id = uuid.uuid4().hex
+    run(seed(user_id))
+    total = len(user_docs(db, user_id))
+
+    async def interrupted():
+        manager = PurgeManager()
+        await manager.start(user_id)
+        monkeypatch.setenv("FAKE_FIRESTORE_LATENCY_MS", "5")
+        await asyncio.sleep(0.05)
+        await manager.stop()  # shutdown mid-purge
+
+    run(interrupted())
+    job = run(database.get_purge_job(user_id))
+    assert job["status"] == "running"
+    assert 0 < len(user_docs(db, user_id)) < total
+
+    monkeypatch.setenv("FAKE_FIRESTORE_LATENCY_MS", "0")
+
+    async def restart():
+        manager = PurgeManager()
+        await manager.resume()
+        assert user_id in manager._tasks
+        return await wait_for(manager, user_id)
+
+    job = run(restart())
+    assert job["status"] == "done"
+    assert user_docs(db, user_id) == []
+    assert db.collection("credentials").document(user_id).get().exists is False
+
+
+def test_writes_are_refused_once_the_purge_starts(db):
+    user_id = uuid.uuid4().hex
+    run(seed(user_id, sessions=1, messages=2))
+
+    async def scenario():
+        manager = PurgeManager()
+        await manager.start(user_id)
+        with pytest.raises(database.UserDeleted):
+            await database.save_mood(user_id, {"mood_score": 5})
+        with pytest.raises(database.UserDeleted):
+            await database.append_conversation_turn(
+                user_id, [{"type": "user", "content": "late"}], session_id="2026-03-09"
+            )
+        return await wait_for(manager, user_id)
+
+    assert run(scenario())["status"] == "done"
+    assert user_docs(db, user_id) == []
+
+
+def test_settle_sweep_removes_writes_that_were_already_in_flight(db):
+    user_id = uuid.uuid4().hex
+    run(seed(user_id, sessions=1, messages=2))
+    manager = PurgeManager()
+    sweep = manager._sweep
+    sweeps = []
+
+    async def sweep_then_late_write(user_id, limiter, progress):
+        await sweep(user_id, limiter, progress)
+        sweeps.append(len(user_docs(db, user_id)))
+        if len(sweeps) == 1:
+            # A write that passed its check just before the purge started
+            db.collection("users").document(user_id).collection("moods").document("late").set(
+                {"mood_score": 1}
+            )
+
+    manager._sweep = sweep_then_late_write
+
+    async def scenario():
+        await manager.start(user_id)
+        return await wait_for(manager, user_id)
+
+    assert run(scenario())["status"] == "done"
+    assert sweeps == [1, 1]  # only the profile doc is left after each sweep
+    assert user_docs(db, user_id) == []
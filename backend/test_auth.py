@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+import main
+import security
+
+# Login must check the password: every /chat, /mood and /user route trusts
+# the token's subject. Run: python -m pytest test_auth.py
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def signup(client, email, password="correct horse"):
+    r = client.post("/auth/signup", json={"name": "Test", "email": email, "password": password})
+    assert r.status_code == 200, r.text
+    return r.json()["user_id"]
+
+
+def login(client, email, password="correct horse"):
+    return client.post("/auth/login", json={"email": email, "password": password})
+
+
+def test_login_requires_the_password(client):
+    user_id = signup(client, "owner@example.com")
+    assert login(client, "owner@example.com", "wrong password").status_code == 401
+    r = login(client, "owner@example.com")
+    assert r.status_code == 200
+    assert r.json()["user_id"] == user_id
+
+
+def test_unknown_email_is_refused(client):
+    assert login(client, "nobody@example.com").status_code == 401
+
+
+def test_token_only_reaches_its_own_user(client):
+    victim = signup(client, "victim@example.com")
+    signup(client, "intruder@example.com")
+    token = login(client, "intruder@example.com").json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get(f"/user/{victim}/profile").status_code == 401
+    assert client.get(f"/user/{victim}/profile", headers=headers).status_code == 403
+    assert client.get(f"/mood/week/{victim}", headers=headers).status_code == 403
+
+
+def test_internal_endpoints_need_the_internal_token(client, monkeypatch):
+    assert client.get("/stats").status_code == 403
+    assert client.get("/metrics").status_code == 403
+
+    monkeypatch.setattr(security, "INTERNAL_API_TOKEN", "scrape-secret")
+    user_token = login(client, "owner@example.com").json()["token"]
+    assert client.get("/stats").status_code == 401
+    assert client.get("/stats", headers={"Authorization": f"Bearer {user_token}"}).status_code == 401
+    headers = {"Authorization": "Bearer scrape-secret"}
+    assert client.get("/stats", headers=headers).status_code == 200
+    assert client.get("/metrics", headers=headers).status_code == 200
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+from auth_provider import FakeAuthProvider, EmailAlreadyExists
+
+# Email lookups: single-flight, no negative caching, canonical email.
+# Run: python -m pytest test_auth_provider.py
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def two_workers():
+    # Two workers' providers in front of one identity store
+    a, b = FakeAuthProvider(), FakeAuthProvider()
+    b._users = a._users
+    return a, b
+
+
+def test_signup_on_one_worker_then_login_on_another():
+    a, b = two_workers()
+    assert run(b.get_user_by_email("new@example.com")) is None  # not cached as missing
+    uid = run(a.create_user("New@Example.com", "pw", "New"))
+    assert run(b.get_user_by_email(" new@example.COM ")) == {
+        "uid": uid,
+        "email": "New@Example.com",  # as stored, not as typed
+    }
+
+
+def test_duplicate_signup_is_refused():
+    provider = FakeAuthProvider()
+    run(provider.create_user("a@example.com", "pw", "A"))
+    with pytest.raises(EmailAlreadyExists):
+        run(provider.create_user("A@example.com", "pw", "A"))
+
+
+def test_concurrent_lookups_share_one_provider_call():
+    provider = FakeAuthProvider()
+    run(provider.create_user("a@example.com", "pw", "A"))
+    provider._accounts.delete("a@example.com")
+    calls = []
+    lookup = provider._lookup
+
+    async def slow_lookup(email):
+        calls.append(email)
+        await asyncio.sleep(0.05)
+        return await lookup(email)
+
+    provider._lookup = slow_lookup
+
+    async def burst(email):
+        return await asyncio.gather(*(provider.get_user_by_email(email) for _ in range(20)))
+
+    found = run(burst("a@example.com"))
+    missing = run(burst("nobody@example.com"))
+
+    assert len({account["uid"] for account in found}) == 1
+    assert missing == [None] * 20
+    assert calls == ["a@example.com", "nobody@example.com"]
+    assert provider._lookups == {}
+    found[0]["uid"] = "changed"
+    assert run(provider.get_user_by_email("a@example.com"))["uid"] != "changed"
+
+
+def test_deleted_account_is_not_served_from_cache():
+    provider = FakeAuthProvider()
+    uid = run(provider.create_user("a@example.com", "pw", "A"))
+    run(provider.delete_user(uid, "a@example.com"))
+    assert run(provider.get_user_by_email("a@example.com")) is None
@@ -0,0 +1,68 @@
+import utils
+
+# Crisis detection must flag everything the original substring check flagged.
+# Run: python -m pytest test_crisis.py
+
+ORIGINAL_KEYWORDS = [
+    "suicide",
+    "kill myself",
+    "hurt myself",
+    "end it all",
+    "want to die",
+    "give up",
+    "can't take it",
+    "no point living",
+]
+
+
+def original_check(message: str) -> bool:
+    return any(keyword in message.lower() for keyword in ORIGINAL_KEYWORDS)
+
+
+FLAGGED = [
+    "suicide's been on my mind",
+    "suicide’s been on my mind",
+    "thinking about suicides",
+    "kill myself2",
+    "suicidewatch",
+    "selfharm",
+    "self-harm again",
+    "I want to kill myself",
+    "I wanna die",
+    "i just want to END IT ALL!!!",
+    "cant take it anymore",
+    "can't take it",
+    "there's no point living",
+    "I give up.",
+    "forgive upset",
+    "#suicideprevention",
+    "hurtmyself",
+    "kiiill myseeelf",
+    "mujhe khudkushi karni hai",
+]
+
+NOT_FLAGGED = [
+    "I'm so stressed about exams, I can't sleep",
+    "my parents keep calling",
+    "had a good day today",
+]
+
+
+def test_flags_known_crisis_messages():
+    missed = [m for m in FLAGGED if not utils.detect_crisis_keywords(m)]
+    assert missed == []
+
+
+def test_ordinary_messages_not_flagged():
+    flagged = [m for m in NOT_FLAGGED if utils.detect_crisis_keywords(m)]
+    assert flagged == []
+
+
+def test_everything_the_original_check_flagged_is_still_flagged():
+    affixes = ["", "x", "2", "s", "'s", " ", ".", "#", "un", "watch"]
+    for keyword in ORIGINAL_KEYWORDS:
+        for before in affixes:
+            for after in affixes:
+                message = f"{before}{keyword}{after}"
+                assert original_check(message)
+                assert utils.detect_crisis_keywords(message), message
@@ -0,0 +1,137 @@
+import asyncio
+import time
+import pytest
+import database
+from database import ReadCoalescer
+from fake_firestore import FakeFirestoreClient
+
+# Read coalescing against the in-memory Firestore fake.
+# Run: python -m pytest test_database.py
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = FakeFirestoreClient()
+    monkeypatch.setattr(database, "_db", client)
+    return client
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def run_all(*coros, **kwargs):
+    async def gather():
+        return await asyncio.gather(*coros, **kwargs)
+
+    return run(gather())
+
+
+def doc(db, path, data=None):
+    ref = db.collection("users").document(path)
+    if data is not None:
+        ref.set(data)
+    return ref
+
+
+def test_reads_in_the_same_tick_share_one_get_all(db):
+    reads = ReadCoalescer()
+    a, b, c = doc(db, "a", {"n": 1}), doc(db, "b", {"n": 2}), doc(db, "missing")
+
+    results = run_all(*(reads.get_document(ref) for ref in (a, b, c)))
+
+    assert results == [{"n": 1}, {"n": 2}, None]
+    assert reads.round_trips == 1
+    assert reads.largest_batch == 3
+
+
+def test_identical_read_joins_the_one_in_flight(db):
+    reads = ReadCoalescer()
+    ref = doc(db, "a", {"tags": ["x"]})
+
+    first, second = run_all(reads.get_document(ref), reads.get_document(ref))
+
+    assert first == second == {"tags": ["x"]}
+    assert (reads.round_trips, reads.coalesced) == (1, 1)
+    first["tags"].append("y")
+    assert second == {"tags": ["x"]}  # every caller gets its own copy
+
+
+class SlowProfileClient(FakeFirestoreClient):
+    def get_all(self, references):
+        # Reads now, answers late
+        snapshots = super().get_all(references)
+        if any(ref.path.startswith("users/") for ref in references):
+            time.sleep(0.2)
+        return snapshots
+
+
+def test_write_drops_in_flight_reads(monkeypatch):
+    # A read that starts after a write must not join one from before it
+    client = SlowProfileClient()
+    monkeypatch.setattr(database, "_db", client)
+    client.collection("users").document("u1").set({"name": "old"})
+
+    async def read_write_read():
+        before = asyncio.create_task(database.get_user("u1"))
+        await asyncio.sleep(0.01)  # the first read is in flight
+        await database.update_user("u1", {"name": "new"})
+        after = await database.get_user("u1")
+        return await before, after
+
+    before, after = run(read_write_read())
+    assert before["name"] == "old"
+    assert after["name"] == "new"
+    assert run(database.get_user("u1"))["name"] == "new"  # nothing stale was cached
+
+
+def test_forget_user_only_drops_that_users_reads(db, monkeypatch):
+    monkeypatch.setenv("FAKE_FIRESTORE_LATENCY_MS", "20")
+    reads = ReadCoalescer()
+    mine = db.collection("users").document("u1").collection("moods").document("m")
+    other = db.collection("users").document("u2")
+
+    async def scenario():
+        tasks = [asyncio.create_task(reads.get_document(ref)) for ref in (mine, other)]
+        await asyncio.sleep(0)
+        reads.forget_user("u1")
+        assert set(reads._inflight) == {("doc", other.path)}
+        await asyncio.gather(*tasks)
+
+    run(scenario())
+
+
+class FailingClient(FakeFirestoreClient):
+    def get_all(self, references):
+        raise RuntimeError("firestore unavailable")
+
+
+def test_errors_reach_every_waiter_and_are_not_kept(monkeypatch):
+    client = FailingClient()
+    monkeypatch.setattr(database, "_db", client)
+    reads = ReadCoalescer()
+    a, b = doc(client, "a", {"n": 1}), doc(client, "b", {"n": 2})
+
+    results = run_all(
+        reads.get_document(a),
+        reads.get_document(a),
+        reads.get_document(b),
+        return_exceptions=True,
+    )
+    assert [str(r) for r in results] == ["firestore unavailable"] * 3
+    assert reads._inflight == {}
+
+    # The next read goes back to Firestore instead of reusing the failure
+    monkeypatch.setattr(database, "_db", FakeFirestoreClient())
+    assert run(reads.get_document(a)) is None
+
+
+def test_single_flight_shares_a_query(db):
+    reads = ReadCoalescer()
+    db.collection("users").document("u1").collection("moods").document("m").set({"s": 1})
+    query = db.collection("users").document("u1").collection("moods")
+    key = ("moods", "u1")
+
+    results = run_all(*(reads.single_flight(key, database._fetch_dicts, query) for _ in range(3)))
+    assert results == [[{"s": 1}]] * 3
+    assert (reads.round_trips, reads.coalesced) == (1, 2)
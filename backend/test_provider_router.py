@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+import provider_router
+from llm_client import ProviderError, ProviderNotConfigured
+from provider_router import ProviderRouter, FakeProvider, CLOSED, OPEN, HALF_OPEN
+
+# Breaker state machine, failover, hedging and cancellation, driven by
+# FakeProvider. Run: python -m pytest test_provider_router.py
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def not_configured(*args):
+    raise ProviderNotConfigured("gemini", "GEMINI_API_KEY not set")
+
+
+def test_breaker_opens_then_half_open_trial_closes_it(monkeypatch):
+    groq = FakeProvider("groq", failure_rate=1.0)
+    router = ProviderRouter({"groq": groq}, order=["groq"])
+    health = router.health["groq"]
+
+    for _ in range(provider_router.BREAKER_MIN_CALLS):
+        with pytest.raises(ProviderError):
+            run(router.complete("groq"))
+    assert health.state == OPEN
+
+    # Open: skipped without a call
+    calls = groq.calls
+    with pytest.raises(ProviderError, match="all circuits open"):
+        run(router.complete("groq"))
+    assert groq.calls == calls
+
+    # Cooldown over: one trial call, which succeeds and closes the breaker
+    monkeypatch.setattr(provider_router, "BREAKER_COOLDOWN", 0)
+    groq.failure_rate = 0.0
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()  # a second caller doesn't get a trial too
+    health.release_trial()
+    assert run(router.complete("groq")) == ("I'm here for you.", "groq")
+    assert health.state == CLOSED
+
+
+def test_failed_trial_reopens_the_breaker(monkeypatch):
+    monkeypatch.setattr(provider_router, "BREAKER_COOLDOWN", 0)
+    router = ProviderRouter({"groq": FakeProvider("groq", failure_rate=1.0)}, order=["groq"])
+    health = router.health["groq"]
+    health.state = OPEN
+    with pytest.raises(ProviderError):
+        run(router.complete("groq"))
+    assert health.state == OPEN
+
+
+def test_fails_over_in_order():
+    groq = FakeProvider("groq", failure_rate=1.0)
+    chatgpt = FakeProvider("chatgpt", reply="from chatgpt")
+    gemini = FakeProvider("gemini", reply="from gemini")
+    router = ProviderRouter(
+        {"groq": groq, "chatgpt": chatgpt, "gemini": gemini}, order=["groq", "chatgpt", "gemini"]
+    )
+    assert run(router.complete("groq")) == ("from chatgpt", "chatgpt")
+    assert router.failovers == 1
+    assert gemini.calls == 0
+
+
+def test_unconfigured_provider_is_skipped_without_counting_against_it():
+    chatgpt = FakeProvider("chatgpt", reply="from chatgpt")
+    router = ProviderRouter(
+        {"gemini": not_configured, "chatgpt": chatgpt}, order=["gemini", "chatgpt"]
+    )
+    for _ in range(provider_router.BREAKER_MIN_CALLS + 1):
+        assert run(router.complete("gemini")) == ("from chatgpt", "chatgpt")
+    health = router.health["gemini"]
+    assert health.state == CLOSED
+    assert len(health.outcomes) == 0
+    assert router.failovers == 0
+
+
+def test_unconfigured_streamer_is_skipped():
+    async def stream_not_configured(*args):
+        raise ProviderNotConfigured("gemini", "GEMINI_API_KEY not set")
+        yield
+
+    chatgpt = FakeProvider("chatgpt", reply="hello there")
+    router = ProviderRouter(
+        {"gemini": not_configured, "chatgpt": chatgpt},
+        streamers={"gemini": stream_not_configured, "chatgpt": chatgpt.stream},
+        order=["gemini", "chatgpt"],
+    )
+
+    async def collect():
+        name, stream = await router.open_stream("gemini")
+        return name, "".join([fragment async for fragment in stream])
+
+    assert run(collect()) == ("chatgpt", "hello there ")
+    assert len(router.health["gemini"].outcomes) == 0
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    monkeypatch.setattr(provider_router, "HEDGE_MIN_DELAY", 0.01)
+    groq = FakeProvider("groq", reply="slow", delay=0.5)
+    chatgpt = FakeProvider("chatgpt", reply="fast")
+    router = ProviderRouter({"groq": groq, "chatgpt": chatgpt}, order=["groq", "chatgpt"])
+    router.hedge_enabled = True
+    router.health["groq"].latencies.extend([0.01] * provider_router.BREAKER_MIN_CALLS)
+
+    assert run(router.complete("groq")) == ("fast", "chatgpt")
+    assert (router.hedges, router.hedge_wins) == (1, 1)
+
+
+def test_cancelled_hedge_releases_the_half_open_trial(monkeypatch):
+    monkeypatch.setattr(provider_router, "HEDGE_MIN_DELAY", 0.01)
+    groq = FakeProvider("groq", delay=5)
+    chatgpt = FakeProvider("chatgpt", delay=5)
+    router = ProviderRouter({"groq": groq, "chatgpt": chatgpt}, order=["groq", "chatgpt"])
+    router.hedge_enabled = True
+    health = router.health["groq"]
+    health.latencies.extend([0.01] * provider_router.BREAKER_MIN_CALLS)
+    health.state = HALF_OPEN
+
+    async def cancel_mid_hedge():
+        task = asyncio.create_task(router.complete("groq"))
+        while chatgpt.calls == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        # Both provider calls were cancelled, not left running
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    run(cancel_mid_hedge())
+    assert router.hedges == 1
+    assert health.state == HALF_OPEN
+    assert health.allow()  # the next call gets the trial
+
+
+def test_cancelled_first_token_wait_releases_the_half_open_trial():
+    groq = FakeProvider("groq", delay=5)
+    router = ProviderRouter({"groq": groq}, streamers={"groq": groq.stream}, order=["groq"])
+    health = router.health["groq"]
+    health.state = HALF_OPEN
+
+    async def cancel_before_first_token():
+        task = asyncio.create_task(router.open_stream("groq"))
+        while groq.calls == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(cancel_before_first_token())
+    assert health.state == HALF_OPEN
+    assert health.allow()
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+import database
+import sessions
+from fake_firestore import FakeFirestoreClient
+from sessions import SessionManager, SESSION_IDLE
+
+# Session rollover and history paging against the in-memory Firestore fake.
+# Run: python -m pytest test_sessions.py
+
+T0 = datetime(2026, 3, 1, 23, 50)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = FakeFirestoreClient()
+    monkeypatch.setattr(database, "_db", client)
+    return client
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def turn(manager, user_id, now, text="hi"):
+    session = await manager.current(user_id, now=now)
+    await manager.save_turn(
+        user_id,
+        session,
+        [
+            {"type": "user", "content": text, "timestamp": now.isoformat()},
+            {"type": "ai", "content": "hello", "timestamp": now.isoformat()},
+        ],
+    )
+    return session["session_id"]
+
+
+def test_session_stays_open_across_midnight_and_rolls_over_after_idle_gap(db):
+    manager = SessionManager()
+    first = run(turn(manager, "u1", T0))
+    assert run(turn(manager, "u1", T0 + timedelta(minutes=20))) == first
+
+    later = T0 + timedelta(minutes=20) + SESSION_IDLE + timedelta(seconds=1)
+    second = run(turn(manager, "u1", later))
+    assert second != first
+    assert (manager.opened, manager.reopened) == (2, 0)
+
+    meta = db.collection("users").document("u1").collection("conversations").document(first).get()
+    assert meta.get("message_count") == 4
+    assert meta.get("local_date") == "2026-03-01"
+
+
+def test_another_worker_reopens_the_latest_session_within_the_gap(db):
+    first = run(turn(SessionManager(), "u1", T0))
+    other_worker = SessionManager()
+    assert run(turn(other_worker, "u1", T0 + timedelta(minutes=5))) == first
+    assert (other_worker.opened, other_worker.reopened) == (0, 1)
+
+
+def test_concurrent_first_messages_share_one_session(db):
+    manager = SessionManager()
+
+    async def both():
+        return await asyncio.gather(manager.current("u1", T0), manager.current("u1", T0))
+
+    a, b = run(both())
+    assert a["session_id"] == b["session_id"]
+    assert manager.opened == 1
+
+
+def test_local_date_uses_the_profile_time_zone(db):
+    run(database.create_user("u1", {"time_zone": "Asia/Kolkata"}))
+    session = run(SessionManager().current("u1", T0))
+    assert session["local_date"] == "2026-03-02"  # 23:50 UTC is 05:20 next day in IST
+
+
+def test_history_cursor_pages_through_equal_timestamps(db):
+    # Messages of one turn share a timestamp; the doc id breaks the tie, so
+    # no message is skipped or repeated at a page boundary
+    conversations = db.collection("users").document("u1").collection("conversations")
+    expected = []
+    for session_id in ("2026-03-01T10:00:00.000000Z", "2026-03-02T10:00:00.000000Z"):
+        conversations.document(session_id).set({"session_id": session_id})
+        for i in range(7):
+            message_id = f"{session_id}-{i}"
+            timestamp = session_id[:11] + "10:00:0" + str(i // 3)
+            conversations.document(session_id).collection("messages").document(message_id).set(
+                {"content": message_id, "timestamp": timestamp}
+            )
+            expected.append((session_id, timestamp, message_id))
+
+    async def walk():
+        seen, cursor, pages = [], None, 0
+        while True:
+            page, cursor = await database.get_message_page("u1", cursor=cursor, limit=4)
+            # Each page is oldest-first; pages go back in time
+            seen += [m["content"] for m in reversed(page)]
+            pages += 1
+            if not cursor:
+                return seen, pages
+
+    seen, pages = run(walk())
+    # Newest first: session, then timestamp, then doc id
+    assert seen == [message_id for _, _, message_id in sorted(expected, reverse=True)]
+    assert pages == 4
@@ -0,0 +1,187 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from cache import TTLCache, MISSING
+from database import get_user, save_user_topics
+from utils import tokenize
+
+# Background topic extraction feeding the "Recent Topics" line of the prompt.
+# chat.py hands each user message to submit() after the reply has been sent;
+# worker tasks pull turns off a bounded queue and score their terms by TF-IDF
+# (each turn is a document; document frequencies come from every turn this
+# worker has seen, so words everyone uses score low). Each user keeps a small
+# table of term scores that decays with TOPIC_HALF_LIFE_HOURS, and the top
+# TOPIC_TOP_K terms become the profile's `keywords`. Changed users are written
+# to Firestore together every TOPIC_FLUSH_INTERVAL seconds.
+
+TOPIC_WORKERS = int(os.getenv("TOPIC_WORKERS", "2"))
+TOPIC_QUEUE_SIZE = int(os.getenv("TOPIC_QUEUE_SIZE", "1000"))
+TOPIC_TOP_K = int(os.getenv("TOPIC_TOP_K", "8"))
+TOPIC_MAX_TERMS = int(os.getenv("TOPIC_MAX_TERMS", "50"))
+TOPIC_HALF_LIFE = float(os.getenv("TOPIC_HALF_LIFE_HOURS", "72")) * 3600
+TOPIC_FLUSH_INTERVAL = float(os.getenv("TOPIC_FLUSH_INTERVAL", "10"))
+MAX_VOCABULARY = 50000
+
+class TopicModel:
+    def __init__(self):
+        self.documents = 0
+        self.document_frequency = Counter()
+
+    def score_turn(self, text: str) -> dict:
+        terms = Counter(tokenize(text))
+        if not terms:
+            return {}
+        self.documents += 1
+        self.document_frequency.update(terms.keys())
+        if len(self.document_frequency) > MAX_VOCABULARY:
+            # Forget one-off words (typos, names) to keep the table bounded
+            self.document_frequency = Counter(
+                {t: n for t, n in self.document_frequency.items() if n > 1}
+            )
+        longest = max(terms.values())
+        return {
+            term: (count / longest)
+            * (math.log((1 + self.documents) / (1 + self.document_frequency[term])) + 1)
+            for term, count in terms.items()
+        }
+
+
+def decay(scores: dict, since: float, now: float) -> dict:
+    factor = 0.5 ** ((now - since) / TOPIC_HALF_LIFE)
+    return {term: score * factor for term, score in scores.items()}
+
+
+def top_terms(scores: dict, k: int = TOPIC_TOP_K) -> list:
+    return [t for t, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]]
+
+
+class TopicPipeline:
+    def __init__(self):
+        self.model = TopicModel()
+        # user_id -> {"scores": {term: score}, "updated_at": epoch seconds}
+        self._users = TTLCache(maxsize=10000, ttl=6 * 3600)
+        self._dirty = set()
+        self._queue = None
+        self._tasks = []
+        self.processed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.users_flushed = 0
+
+    def submit(self, user_id: str, text: str):
+        # Never blocks the request: a full queue drops the turn
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait((user_id, text, time.time()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _load_state(self, user_id: str) -> dict:
+        state = self._users.get(user_id)
+        if state is not MISSING:
+            return state
+        # Cold start from what was last flushed (or the plain keyword list)
+        user = await get_user(user_id) or {}
+        state = self._users.get(user_id)
+        if state is not MISSING:
+            # Another worker loaded it meanwhile
+            return state
+        scores = user.get("topic_scores")
+        if not scores:
+            keywords = user.get("keywords", [])
+            scores = {kw: float(len(keywords) - i) for i, kw in enumerate(keywords)}
+        state = {"scores": dict(scores), "updated_at": user.get("topics_updated_at", time.time())}
+        self._users.set(user_id, state)
+        return state
+
+    async def process(self, user_id: str, text: str, at: float):
+        turn = self.model.score_turn(text)
+        if not turn:
+            return
+        state = await self._load_state(user_id)
+        scores = decay(state["scores"], state["updated_at"], at)
+        for term, weight in turn.items():
+            scores[term] = scores.get(term, 0.0) + weight
+        if len(scores) > TOPIC_MAX_TERMS:
+            scores = {t: scores[t] for t in top_terms(scores, TOPIC_MAX_TERMS)}
+        state["scores"], state["updated_at"] = scores, at
+        self._users.set(user_id, state)
+        self._dirty.add(user_id)
+        self.processed += 1
+
+    async def _worker(self):
+        while True:
+            user_id, text, at = await self._queue.get()
+            try:
+                await self.process(user_id, text, at)
+            except Exception as e:
+                print(f"⚠️ Topic extraction failed for {user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        updates = {}
+        for user_id in dirty:
+            state = self._users.get(user_id)
+            if state is MISSING:
+                continue
+            scores = {t: round(s, 4) for t, s in state["scores"].items()}
+            updates[user_id] = {
+                "keywords": top_terms(scores),
+                "topic_scores": scores,
+                "topics_updated_at": state["updated_at"],
+            }
+        if not updates:
+            return
+        try:
+            await save_user_topics(updates)
+        except Exception as e:
+            print(f"⚠️ Topic flush failed, will retry: {e}")
+            self._dirty |= set(updates)
+            return
+        self.flushes += 1
+        self.users_flushed += len(updates)
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(TOPIC_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=TOPIC_QUEUE_SIZE)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(TOPIC_WORKERS)]
+        self._tasks.append(asyncio.create_task(self._flusher()))
+
+    async def stop(self):
+        # Finish queued turns and write everything out before shutdown
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+        await self.flush()
+
+    def forget(self, user_id: str):
+        # Account deleted: a pending flush must not recreate the profile
+        self._users.delete(user_id)
+        self._dirty.discard(user_id)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "pending_users": len(self._dirty),
+            "flushes": self.flushes,
+            "users_flushed": self.users_flushed,
+            "vocabulary": len(self.model.document_frequency),
+        }
+
+
+topic_pipeline = TopicPipeline()
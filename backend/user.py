@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from database import get_user, update_user, delete_user
+from database import get_user, update_user, get_purge_job
+from account_data import export_user_data, import_user_data, purge_manager
+from security import authorize_user, authorize_account_deletion
+from sessions import is_valid_time_zone
 from typing import Optional
 
+# Every route here is scoped to the authenticated user's own {user_id}.
+# Once deletion has started only the deletion routes accept the user's token.
 router = APIRouter()
 
 
@@ -10,9 +16,10 @@ class UpdateProfileRequest(BaseModel):
     bio: Optional[str] = None
     emergency_contact: Optional[str] = None
     preferred_model: Optional[str] = None
+    time_zone: Optional[str] = None  # IANA name, e.g. "Asia/Kolkata"
 
 
-@router.get("/{user_id}/profile")
+@router.get("/{user_id}/profile", dependencies=[Depends(authorize_user)])
 async def get_profile(user_id: str):
     user = await get_user(user_id)
     if not user:
@@ -20,14 +27,50 @@ async def get_profile(user_id: str):
     return user
 
 
-@router.put("/{user_id}/profile")
+@router.put("/{user_id}/profile", dependencies=[Depends(authorize_user)])
 async def update_profile(user_id: str, request: UpdateProfileRequest):
     data = {k: v for k, v in request.dict().items() if v is not None}
+    if "time_zone" in data and not is_valid_time_zone(data["time_zone"]):
+        raise HTTPException(status_code=400, detail="Unknown time zone")
     await update_user(user_id, data)
     return {"success": True, "message": "Profile updated"}
 
 
-@router.delete("/{user_id}")
+@router.get("/{user_id}/export", dependencies=[Depends(authorize_user)])
+async def export_account(user_id: str, gzip: bool = False):
+    # Streamed page by page; see docs/API_REFERENCE.md for the record format
+    filename = f"mindmate-export-{user_id}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_user_data(user_id, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/{user_id}/import", dependencies=[Depends(authorize_user)])
+async def import_account(user_id: str, request: Request):
+    # Body: an export file (NDJSON, plain or gzipped)
+    try:
+        counts = await import_user_data(user_id, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "imported": counts}
+
+
+@router.delete(
+    "/{user_id}", status_code=202, dependencies=[Depends(authorize_account_deletion)]
+)
 async def delete_account(user_id: str):
-    await delete_user(user_id)
-    return {"success": True, "message": "Account deleted"}
+    # Profile, conversations, moods and the sign-in account are removed by a
+    # background job; poll GET /user/{user_id}/purge for progress.
+    job = await purge_manager.start(user_id)
+    return {"success": True, "message": "Account deletion started", "status": job["status"]}
+
+
+@router.get("/{user_id}/purge", dependencies=[Depends(authorize_account_deletion)])
+async def purge_status(user_id: str):
+    job = await get_purge_job(user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="No deletion in progress")
+    job.pop("email", None)
+    return job
@@ -4,15 +4,42 @@ from datetime import datetime, timedelta
 from typing import Optional
 import os
 import re
+import json
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import unicodedata
+from collections import Counter
 
 # Config
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_key")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", str(60 * 24)))  # 24 hours
 
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+# Signing keys by kid. JWT_SIGNING_KEYS='{"2024-06": "secret-b", "2024-01": "secret-a"}'
+# signs new tokens with JWT_ACTIVE_KID and still accepts tokens from every
+# listed key. To rotate: add the new kid, make it active, and drop the old one
+# once its tokens have expired. Without JWT_SIGNING_KEYS, SECRET_KEY is the
+# only key (kid "default").
+def _load_signing_keys() -> dict:
+    raw = os.getenv("JWT_SIGNING_KEYS")
+    if not raw:
+        return {"default": SECRET_KEY}
+    keys = json.loads(raw)
+    if not isinstance(keys, dict) or not keys:
+        raise RuntimeError("JWT_SIGNING_KEYS must be a non-empty JSON object of kid -> secret")
+    return keys
+
+
+SIGNING_KEYS = _load_signing_keys()
+ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS))
+if ACTIVE_KID not in SIGNING_KEYS:
+    raise RuntimeError(f"JWT_ACTIVE_KID {ACTIVE_KID!r} is not in JWT_SIGNING_KEYS")
+
+
+def hash_password(password: str, rounds: int = None) -> str:
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
     return hashed.decode("utf-8")
 
@@ -23,20 +50,125 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     )
 
 
+# --- Password Hashing Pool ---
+# bcrypt is ~100-300 ms of pure CPU per call, so async routes must use the
+# *_async variants: they run on a small process pool, at most
+# BCRYPT_MAX_CONCURRENCY at a time, and the rest wait on a semaphore instead
+# of piling onto the pool. Chat traffic on the same worker keeps running
+# during a login storm. Workers are started with forkserver (spawn where that
+# doesn't exist), never fork: forking a process that already runs the
+# Firestore and auth thread pools can copy a held lock into the child.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_MAX_WORKERS = int(os.getenv("BCRYPT_MAX_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+BCRYPT_MAX_CONCURRENCY = int(os.getenv("BCRYPT_MAX_CONCURRENCY", str(BCRYPT_MAX_WORKERS)))
+
+_password_pool = None
+_password_slots = None
+_password_stats = {"queued": 0, "running": 0, "completed": 0, "rehashed": 0, "max_queue_depth": 0}
+
+
+def _get_password_pool():
+    global _password_pool
+    if _password_pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _password_pool = ProcessPoolExecutor(
+            max_workers=BCRYPT_MAX_WORKERS, mp_context=multiprocessing.get_context(method)
+        )
+    return _password_pool
+
+
+async def _run_password_job(fn, *args):
+    global _password_slots
+    if _password_slots is None:
+        _password_slots = asyncio.Semaphore(BCRYPT_MAX_CONCURRENCY)
+    _password_stats["queued"] += 1
+    _password_stats["max_queue_depth"] = max(
+        _password_stats["max_queue_depth"], _password_stats["queued"]
+    )
+    try:
+        await _password_slots.acquire()
+    finally:
+        _password_stats["queued"] -= 1
+    _password_stats["running"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_pool(), fn, *args)
+    finally:
+        _password_stats["running"] -= 1
+        _password_stats["completed"] += 1
+        _password_slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(hash_password, password, BCRYPT_ROUNDS)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    # "$2b$12$..." -> cost 12
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    # Returns (valid, new_hash). new_hash is set when the stored hash was made
+    # with a different BCRYPT_ROUNDS and should be saved in its place.
+    if not await verify_password_async(plain_password, hashed_password):
+        return False, None
+    if not password_needs_rehash(hashed_password):
+        return True, None
+    _password_stats["rehashed"] += 1
+    return True, await hash_password_async(plain_password)
+
+
+def get_password_pool_stats() -> dict:
+    return {
+        "rounds": BCRYPT_ROUNDS,
+        "workers": BCRYPT_MAX_WORKERS,
+        "max_concurrency": BCRYPT_MAX_CONCURRENCY,
+        "queue_depth": _password_stats["queued"],
+        **{k: v for k, v in _password_stats.items() if k != "queued"},
+    }
+
+
+def shutdown_password_pool():
+    global _password_pool
+    if _password_pool is not None:
+        _password_pool.shutdown(wait=False, cancel_futures=True)
+        _password_pool = None
+
+
 def generate_jwt(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(
+        to_encode,
+        SIGNING_KEYS[ACTIVE_KID],
+        algorithm=ALGORITHM,
+        headers={"kid": ACTIVE_KID},
+    )
     return encoded_jwt
 
 
 def verify_jwt(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Tokens issued before kids existed carry none: they were signed with SECRET_KEY
+        kid = jwt.get_unverified_header(token).get("kid", "default")
+        key = SIGNING_KEYS.get(kid)
+        if key is None:
+            return None
+        payload = jwt.decode(
+            token, key, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]}
+        )
         return payload
     except jwt.PyJWTError:
         return None
@@ -47,38 +179,126 @@ def validate_email(email: str) -> bool:
     return re.match(pattern, email) is not None
 
 
+# --- Crisis Detection ---
+# The lexicon is compiled once into a single prefix-factored regex (a trie of
+# all phrases), so a message is scanned in one pass no matter how many
+# phrases there are. Phrases are normalized up front; the pattern itself
+# tolerates repeated letters ("kil" / "killl") and any run of whitespace or
+# punctuation between words (including none: "selfharm"), so messages only
+# need a cheap normalization.
+# Matching is deliberately substring-style, like the original keyword check:
+# "suicides", "suicidewatch" and "kill myself2" must all fire. A false alarm
+# costs a helpline message; a miss costs far more.
+
+CRISIS_KEYWORDS_FILE = os.getenv(
+    "CRISIS_KEYWORDS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_keywords.txt"),
+)
+
+_APOSTROPHES = {ord(c): None for c in "'\u2018\u2019\u02bc\u0060\u00b4"}
+_NON_WORD = re.compile(r"[\W_]+")
+_REPEATS = re.compile(r"(\w)\1+")
+
+
+def normalize_text(text: str) -> str:
+    # Case, width/compatibility forms and apostrophes (can't / can’t / cant)
+    return unicodedata.normalize("NFKC", text).casefold().translate(_APOSTROPHES)
+
+
+def normalize_phrase(phrase: str) -> str:
+    phrase = _NON_WORD.sub(" ", normalize_text(phrase)).strip()
+    return _REPEATS.sub(r"\1", phrase)
+
+
+def _char_pattern(ch: str) -> str:
+    if ch == " ":
+        return r"[\W_]*"
+    # Literal first, so the regex engine can skip ahead on its first character
+    return re.escape(ch) + re.escape(ch) + "*"
+
+
+def _trie_pattern(phrases) -> str:
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alternatives = []
+        for ch, child in sorted(node.items()):
+            if not ch:
+                continue
+            alternatives.append(_char_pattern(ch) + build(child))
+        if not alternatives:
+            return ""
+        optional = "" in node
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")" + ("?" if optional else "")
+
+    return build(trie)
+
+
+def load_crisis_phrases(path: str = None) -> list:
+    with open(path or CRISIS_KEYWORDS_FILE, encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def compile_crisis_matcher(phrases):
+    normalized = {normalize_phrase(p) for p in phrases}
+    normalized.discard("")
+    if not normalized:
+        return None
+    return re.compile(_trie_pattern(normalized))
+
+
+_crisis_matcher = compile_crisis_matcher(load_crisis_phrases())
+
+
+def reload_crisis_keywords(path: str = None):
+    # Swap in a new lexicon (e.g. an updated or multilingual file) at runtime
+    global _crisis_matcher
+    _crisis_matcher = compile_crisis_matcher(load_crisis_phrases(path))
+
+
 def detect_crisis_keywords(message: str) -> bool:
-    crisis_keywords = [
-        "suicide",
-        "kill myself",
-        "hurt myself",
-        "end it all",
-        "want to die",
-        "give up",
-        "can't take it",
-        "no point living",
-    ]
-    message_lower = message.lower()
-    return any(keyword in message_lower for keyword in crisis_keywords)
+    if _crisis_matcher is None:
+        return False
+    return _crisis_matcher.search(normalize_text(message)) is not None
+
+
+# --- Keywords ---
+
+STOPWORDS = frozenset(
+    """
+    about above after again against all also always am and any anything are
+    around because been before being below between both but can cant could did
+    didnt does doesnt doing dont down during each even ever every feel feeling
+    feels felt few for from get gets getting going gonna got had has have having
+    her here hers herself him himself his how idk just know like lot more most
+    much myself need never not now off once only other our ours ourselves out
+    over own really right same she should some something still such than that
+    thats the their theirs them themselves then there these they thing things
+    think this those through today too under until very want wanna was way were
+    what when where which while who whom why will with would yeah yes you your
+    yours yourself yourselves okay hey hello thanks thank please
+    aaj bahut bhi hai hain hoon kya kuch main mera mere mujhe nahi nhi par
+    raha rahi rha rhi tha thi toh yaar
+    """.split()
+)
+
+_WORDS = re.compile(r"[^\W\d_]{3,}")
+
+
+def tokenize(text: str) -> list:
+    # Content words of a message, in order (normalized, stopwords removed)
+    return [w for w in _WORDS.findall(normalize_text(text)) if w not in STOPWORDS]
 
 
 def extract_keywords(text: str) -> list:
-    # Simple keyword extraction for MVP (stopwords removal could be added)
-    ignore_words = {
-        "the",
-        "a",
-        "an",
-        "and",
-        "or",
-        "but",
-        "is",
-        "are",
-        "was",
-        "were",
-        "i",
-        "my",
-        "me",
-    }
-    words = text.lower().split()
-    keywords = [w for w in words if w not in ignore_words and len(w) > 3]
-    return list(set(keywords))[:5]  # Return top 5 unique keywords
+    # Most frequent content words of one message, ties in order of appearance.
+    # Topics across a user's history come from topics.py.
+    return [w for w, _ in Counter(tokenize(text)).most_common(5)]
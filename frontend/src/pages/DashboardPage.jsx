@@ -34,7 +34,7 @@ const DashboardPage = () => {
         const fetchMoods = async () => {
             try {
                 // Fetching last 50 moods to get a good history
-                const response = await moodAPI.getMoodWeek(userId);
+                const response = await moodAPI.getMoodWeek(userId, true);
                 setMoods(response.data.moods || []);
             } catch (error) {
                 console.error('Error fetching mood history', error);
@@ -37,7 +37,7 @@ export const chatAPI = {
 export const moodAPI = {
     logMood: (userId, emoji, score, note = null) => api.post('/mood/log', { user_id: userId, mood_emoji: emoji, mood_score: score, note, timestamp: new Date().toISOString() }),
     getMoodToday: (userId) => api.get(`/mood/today/${userId}`),
-    getMoodWeek: (userId) => api.get(`/mood/week/${userId}`),
+    getMoodWeek: (userId, includeMoods = false) => api.get(`/mood/week/${userId}`, { params: { include_moods: includeMoods } }),
 };
 
 export default api;